@@ -21,39 +21,100 @@ This script automates the process of repairing Python wheels to ensure compatibi
 1. Fetch wheel metadata from Artifactory.
 2. Download wheels to a local directory.
 3. Run `auditwheel repair` on each wheel.
-4. Upload the successfully repaired wheels back to Artifactory.
+4. Optionally inject bundled licenses and suffix the version (LICENSE_SUFFIX, see license.py).
 5. Test the repaired wheels by attempting to install them in isolated virtual environments.
-6. Generate summary reports of the repair process.
+6. Upload the successfully repaired wheels back to Artifactory.
+7. Generate summary reports of the repair process.
 Environment Variables:
 The script uses several configuration variables defined in the `config.py` file.
 """
 
 
 import os
-import csv
 import zipfile
-import shutil
 import subprocess
+import time
+import queue
+import shutil
+import hashlib
+import threading
+import license
 import requests
-import tempfile
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from config import *
+from venv_pool import VenvPool
+from state_store import StateStore
+from download_cache import DownloadCache
+from repair_engine import RepairEngine
+from metrics import Counters, Registry, BYTES_PER_SECOND_BUCKETS
 
 HEADERS = {"X-JFrog-Art-Api": JFROG_API_KEY}
 
-#Summary of entire run
-SUMMARY = {
-    "total": 0,
-    "audit_success": 0,
-    "audit_failed": 0,
-    "pip_success": 0,
-    "pip_failed": 0,
-    "pip_skipped": 0,
-    "no_elf": 0,
-    "native_repaired": 0,
-    "already_processed": 0,
-    "newly_processed": 0,
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def get_session():
+    """Return the shared keep-alive session used for all Artifactory calls."""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            retry = Retry(
+                total=HTTP_RETRIES,
+                backoff_factor=HTTP_BACKOFF,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=("GET", "PUT", "POST"),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=HTTP_POOL_SIZE,
+                pool_block=True,
+                max_retries=retry,
+            )
+            s = requests.Session()
+            s.headers.update(HEADERS)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _SESSION = s
+        return _SESSION
+
+#Summary of entire run, updated concurrently by pipeline workers
+SUMMARY = Counters(
+    [
+        "total",
+        "audit_success",
+        "audit_failed",
+        "pip_success",
+        "pip_failed",
+        "pip_skipped",
+        "no_elf",
+        "native_repaired",
+        "already_processed",
+        "newly_processed",
+        "license_applied",
+        "license_failed",
+    ]
+)
+
+# Live metrics, served on METRICS_PORT and/or flushed to METRICS_FILE
+METRICS = Registry("auditwheel")
+METRICS.add_counters("summary", "Run summary counters.", SUMMARY)
+STAGE_SECONDS = {
+    "download_seconds": METRICS.histogram("download_seconds", "Wheel download time."),
+    "repair_seconds": METRICS.histogram("repair_seconds", "auditwheel repair time."),
+    "license_seconds": METRICS.histogram("license_seconds", "License injection and version suffix time."),
+    "pip_seconds": METRICS.histogram("pip_seconds", "pip install test time."),
+    "upload_seconds": METRICS.histogram("upload_seconds", "Wheel upload time."),
 }
+DOWNLOAD_THROUGHPUT = METRICS.histogram(
+    "download_bytes_per_second",
+    "Per-wheel download throughput from Artifactory (cache misses only).",
+    BYTES_PER_SECOND_BUCKETS,
+)
+DOWNLOAD_CACHE_HITS = Counters(["hit", "miss"])
+METRICS.add_counters("download_cache", "Download cache lookups.", DOWNLOAD_CACHE_HITS)
 
 # Helper to run a command and capture output
 def run(cmd):
@@ -71,6 +132,21 @@ PYTHON_BIN_MAP = {
     "cp313": "/opt/python/cp313-cp313/bin/python",
 }
 
+# Pre-warmed venvs used for pip install tests, shared by all workers
+VENV_POOL = VenvPool(PYTHON_BIN_MAP, VENV_POOL_SIZE)
+
+# Persistent auditwheel worker processes (None: one CLI process per wheel).
+# Created in main() so that spawned workers importing this module don't
+# start pools of their own.
+REPAIR_ENGINE = None
+
+# Wheels keyed by Artifactory sha256, kept across runs
+DOWNLOAD_CACHE = (
+    DownloadCache(DOWNLOAD_CACHE_DIR, DOWNLOAD_CACHE_MAX_BYTES)
+    if DOWNLOAD_CACHE_DIR
+    else None
+)
+
 
 def extract_python_tag(name):
     """Extract the python tag from a wheel filename."""
@@ -80,21 +156,6 @@ def extract_python_tag(name):
     return None
 
 
-def create_venv(py):
-    """Create a virtual environment using the specified python binary."""
-    d = tempfile.mkdtemp(prefix="wheel-venv-")
-    subprocess.check_call([py, "-m", "venv", d])
-    return d
-
-
-def upgrade_pip(venv):
-    """Upgrade pip, setuptools, wheel in the specified venv."""
-    py = os.path.join(venv, "bin", "python")
-    subprocess.check_call(
-        [py, "-m", "pip", "install", "--upgrade", "pip", "setuptools", "wheel"]
-    )
-
-
 def pip_install(venv, wheel):
     """Install the specified wheel into the specified venv."""
     py = os.path.join(venv, "bin", "python")
@@ -111,26 +172,56 @@ def upload(wheel, pkg, ver):
     path = f"{UPLOAD_ROOT_FOLDER}/{pkg}/{ver}/{os.path.basename(wheel)}"
     url = f"{ART_URL}/{TARGET_UPLOAD_REPO}/{path}"
     with open(wheel, "rb") as f:
-        r = requests.put(url, headers=HEADERS, data=f)
+        r = get_session().put(url, data=f, timeout=HTTP_TIMEOUT)
     if r.status_code not in (200, 201):
         raise RuntimeError(r.text)
 
 
-def fetch_wheels():
-    """Fetch wheel metadata from Artifactory."""
-    query = (
+def fetch_wheels(modified_since=None):
+    """
+    Fetch wheel metadata from Artifactory.
+
+    Generator: the AQL listing is paged with .offset()/.limit() in name order
+    and items are yielded as each page arrives, so callers can start work
+    before the full listing is back and memory stays bounded by the page size.
+    With modified_since (an AQL timestamp) only artifacts modified at or after
+    it are listed.
+    """
+    since_filter = ""
+    if modified_since:
+        since_filter = f',"modified": {{"$gte": "{modified_since}"}}'
+
+    base_query = (
         "items.find({"
         f'"repo": "{SOURCE_REPO}",'
         '"name": {"$match": "*.whl"},'
         '"path": {"$nmatch": ".pypi*"}'
-        '}).include("repo","path","name")'
+        f"{since_filter}"
+        '}).include("repo","path","name","created","modified","sha256")'
+        '.sort({"$asc": ["name","path"]})'
     )
 
-    r = requests.post(JFROG_AQL_URL, headers=HEADERS, data=query)
-    r.raise_for_status()
+    offset = 0
+    yielded = 0
+    while True:
+        limit = AQL_PAGE_SIZE
+        if MAX_TOTAL_WHEELS:
+            limit = min(limit, MAX_TOTAL_WHEELS - yielded)
+            if limit <= 0:
+                return
 
-    wheels = r.json().get("results", [])
-    return wheels[:MAX_TOTAL_WHEELS] if MAX_TOTAL_WHEELS else wheels
+        query = f"{base_query}.offset({offset}).limit({limit})"
+        r = get_session().post(JFROG_AQL_URL, data=query, timeout=HTTP_TIMEOUT)
+        r.raise_for_status()
+        page = r.json().get("results", [])
+
+        for item in page:
+            yield item
+        yielded += len(page)
+        offset += len(page)
+
+        if len(page) < limit:
+            return
 
 
 def download(item):
@@ -139,37 +230,70 @@ def download(item):
     d = os.path.join(DOWNLOAD_DIR, pkg, ver)
     os.makedirs(d, exist_ok=True)
     p = os.path.join(d, item["name"])
-    if not os.path.exists(p):
-        url = f"{ART_URL}/{item['repo']}/{item['path']}/{item['name']}"
-        with requests.get(url, headers=HEADERS, stream=True) as r:
-            r.raise_for_status()
-            with open(p, "wb") as f:
-                for c in r.iter_content(1024 * 1024):
-                    if c:
-                        f.write(c)
+    if os.path.exists(p):
+        return p
+
+    sha256 = item.get("sha256")
+    if sha256 and DOWNLOAD_CACHE is not None:
+        if DOWNLOAD_CACHE.get(sha256, p):
+            DOWNLOAD_CACHE_HITS.inc("hit")
+            return p
+        DOWNLOAD_CACHE_HITS.inc("miss")
+
+    url = f"{ART_URL}/{item['repo']}/{item['path']}/{item['name']}"
+    part = p + ".part"
+    h = hashlib.sha256()
+    size = 0
+    t = time.monotonic()
+    with get_session().get(url, stream=True, timeout=HTTP_TIMEOUT) as r:
+        r.raise_for_status()
+        with open(part, "wb") as f:
+            for c in r.iter_content(1024 * 1024):
+                if c:
+                    h.update(c)
+                    f.write(c)
+                    size += len(c)
+    elapsed = time.monotonic() - t
+    if elapsed > 0:
+        DOWNLOAD_THROUGHPUT.observe(size / elapsed)
+
+    if sha256 and h.hexdigest() != sha256.lower():
+        os.remove(part)
+        raise RuntimeError(f"sha256 mismatch for {item['name']}")
+    os.replace(part, p)
+
+    if sha256 and DOWNLOAD_CACHE is not None:
+        DOWNLOAD_CACHE.put(sha256, p)
     return p
 
 
 def auditwheel_repair(wheel, pkg, ver):
     """Run auditwheel repair on the specified wheel."""
-    out = os.path.join(REPAIRED_DIR, pkg, ver)
+    # One output dir per input wheel: python tags of the same pkg/ver are
+    # repaired concurrently and must not pick up each other's results.
+    out = os.path.join(REPAIRED_DIR, pkg, ver, os.path.basename(wheel)[:-4])
     os.makedirs(out, exist_ok=True)
+
+    args = [
+        "repair",
+        "--plat",
+        "manylinux_2_34_ppc64le",
+        "--only-plat",
+        wheel,
+        "-w",
+        out,
+    ]
+
+    if REPAIR_ENGINE is not None:
+        return REPAIR_ENGINE.run(args), out
+
     """ Set LD_LIBRARY_PATH to ensure auditwheel can find system libs """
     env = os.environ.copy()
-    env["LD_LIBRARY_PATH"] = "/usr/local/lib64:/usr/local/lib"
+    env["LD_LIBRARY_PATH"] = AUDITWHEEL_LD_LIBRARY_PATH
 
     return (
         subprocess.run(
-            [
-                "auditwheel",
-                "repair",
-                "--plat",
-                "manylinux_2_34_ppc64le",
-                "--only-plat",
-                wheel,
-                "-w",
-                out,
-            ],
+            ["auditwheel"] + args,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
@@ -179,11 +303,19 @@ def auditwheel_repair(wheel, pkg, ver):
     )
 
 
-def process_wheel(item):
-    """Process a single wheel: download, auditwheel repair, pip install, upload."""
-    SUMMARY["total"] += 1
+def stage_download(item):
+    """Pipeline stage: download the wheel and work out which interpreter tests it."""
+    SUMMARY.inc("total")
+    timings = {}
 
+    t = time.monotonic()
     wheel = download(item)
+    timings["download_seconds"] = time.monotonic() - t
+    return new_job(wheel, timings)
+
+
+def new_job(wheel, timings):
+    """Job dict for a wheel on local disk, as handed from stage to stage."""
     name = os.path.basename(wheel)
     print("DEBUG name =", repr(name))
     pkg, ver = name.split("-")[0:2]
@@ -199,59 +331,49 @@ def process_wheel(item):
     if "abi3" in name and py_tag not in PYTHON_BIN_MAP:
         py_tag = "cp311"
 
-    audit_status = "SUCCESS"
-    audit_msg = ""
-    pip_status = "SKIPPED"
-    pip_msg = ""
-
-    bundled_libs = []
-    wheel_to_test = wheel
+    return {
+        "name": name,
+        "pkg": pkg,
+        "ver": ver,
+        "py_tag": py_tag,
+        "wheel": wheel,
+        "wheel_to_test": wheel,
+        "audit_status": "SUCCESS",
+        "audit_msg": "",
+        "pip_status": "SKIPPED",
+        "pip_msg": "",
+        "bundled_libs": [],
+        "upload": False,
+        "done": False,
+        "timings": timings,
+    }
+
+
+def stage_repair(job):
+    """Pipeline stage: auditwheel repair (skipped for no-arch wheels)."""
+    name = job["name"]
 
     # --------------------------------------------------
     # NO-ARCH wheels: py3-none-any / py2.py3-none-any
     # --------------------------------------------------
     if name.endswith("-py3-none-any.whl") or name.endswith("-py2.py3-none-any.whl"):
-        audit_status = "SUCCESS"
-        audit_msg = "no-arch wheel (auditwheel skipped)"
-        pip_status = "SKIPPED"
-        pip_msg = ""
-        bundled_libs = []
-
-        SUMMARY["no_elf"] += 1
-        SUMMARY["audit_success"] += 1
+        job["audit_status"] = "SUCCESS"
+        job["audit_msg"] = "no-arch wheel (auditwheel skipped)"
 
-        # Upload original wheel directly
-        upload(wheel, pkg, ver)
+        SUMMARY.inc("no_elf")
+        SUMMARY.inc("audit_success")
 
-        # ---- pip test MUST still happen ----
-        if py_tag in PYTHON_BIN_MAP:
-            venv = create_venv(PYTHON_BIN_MAP[py_tag])
-            try:
-                upgrade_pip(venv)
-                r = pip_install(venv, wheel)
-                if r.returncode == 0:
-                    pip_status = "SUCCESS"
-                    SUMMARY["pip_success"] += 1
-                else:
-                    pip_status = "FAILED"
-                    pip_msg = r.stderr.strip().splitlines()[-1]
-                    SUMMARY["pip_failed"] += 1
-            finally:
-                shutil.rmtree(venv, ignore_errors=True)
-
-        # Cleanup
-        try:
-            if os.path.exists(wheel):
-                os.remove(wheel)
-        except Exception:
-            pass
-
-        return name, audit_status, audit_msg, pip_status, pip_msg, bundled_libs
+        # Original wheel is uploaded whatever the pip test says
+        job["upload"] = True
+        return job
 
     # --------------------------------------------------
     # auditwheel repair for native wheels
     # --------------------------------------------------
-    res, out = auditwheel_repair(wheel, pkg, ver)
+    t = time.monotonic()
+    res, out = auditwheel_repair(job["wheel"], job["pkg"], job["ver"])
+    job["timings"]["repair_seconds"] = time.monotonic() - t
+    job["repair_dir"] = out
 
     # ---------------------------
     # auditwheel FAILED
@@ -261,16 +383,17 @@ def process_wheel(item):
 
         # True no-arch wheel (py3-none-any should never reach here anyway)
         if "no elf" in err:
-            audit_status = "SUCCESS"
-            audit_msg = "no ELF files found (no-arch wheel)"
-            SUMMARY["no_elf"] += 1
-            SUMMARY["audit_success"] += 1
+            job["audit_status"] = "SUCCESS"
+            job["audit_msg"] = "no ELF files found (no-arch wheel)"
+            SUMMARY.inc("no_elf")
+            SUMMARY.inc("audit_success")
         else:
-            audit_status = "FAILED"
-            audit_msg = res.stderr.strip().splitlines()[-1]
-            SUMMARY["audit_failed"] += 1
-            SUMMARY["pip_skipped"] += 1
-            return name, audit_status, audit_msg, "SKIPPED", "", []
+            job["audit_status"] = "FAILED"
+            job["audit_msg"] = res.stderr.strip().splitlines()[-1]
+            SUMMARY.inc("audit_failed")
+            SUMMARY.inc("pip_skipped")
+            job["done"] = True
+            return job
 
     # ---------------------------
     # auditwheel SUCCEEDED
@@ -283,152 +406,356 @@ def process_wheel(item):
 
     if not repaired_wheels:
         # ❗ THIS is the missing enforcement
-        audit_status = "FAILED"
-        audit_msg = "auditwheel succeeded but produced no manylinux wheel"
-        SUMMARY["audit_failed"] += 1
-        SUMMARY["pip_skipped"] += 1
-        return name, audit_status, audit_msg, "SKIPPED", "", []
+        job["audit_status"] = "FAILED"
+        job["audit_msg"] = "auditwheel succeeded but produced no manylinux wheel"
+        SUMMARY.inc("audit_failed")
+        SUMMARY.inc("pip_skipped")
+        job["done"] = True
+        return job
 
     # ---------------------------
     # Valid manylinux wheel
     # ---------------------------
-    wheel_to_test = repaired_wheels[0]
-    SUMMARY["native_repaired"] += 1
-
-    with zipfile.ZipFile(wheel_to_test) as z:
-        bundled_libs = [n for n in z.namelist() if n.endswith(".so")]
-
-    audit_status = "SUCCESS"
-    SUMMARY["audit_success"] += 1
-
-
-    # --------------------------------------------------
-    # Test pip install
-    # --------------------------------------------------
-    if py_tag in PYTHON_BIN_MAP:
-        venv = create_venv(PYTHON_BIN_MAP[py_tag])
-        try:
-            upgrade_pip(venv)
-            r = pip_install(venv, wheel_to_test)
-            if r.returncode == 0:
-                pip_status = "SUCCESS"
-                SUMMARY["pip_success"] += 1
-                upload(wheel_to_test, pkg, ver)
-            else:
-                pip_status = "FAILED"
-                pip_msg = r.stderr.strip().splitlines()[-1]
-                SUMMARY["pip_failed"] += 1
-        finally:
-            shutil.rmtree(venv, ignore_errors=True)
-
-    # --------------------------------------------------
-    # Cleanup of temporary files
-    # --------------------------------------------------
-    for f in {wheel, wheel_to_test}:
+    job["wheel_to_test"] = repaired_wheels[0]
+    SUMMARY.inc("native_repaired")
+
+    with zipfile.ZipFile(job["wheel_to_test"]) as z:
+        job["bundled_libs"] = [n for n in z.namelist() if n.endswith(".so")]
+
+    job["audit_status"] = "SUCCESS"
+    SUMMARY.inc("audit_success")
+    return job
+
+
+def stage_license(job):
+    """Pipeline stage: inject bundled licenses and suffix the version in place."""
+    if not LICENSE_SUFFIX:
+        return job
+
+    t = time.monotonic()
+    try:
+        job["wheel_to_test"] = license.process_wheel(job["wheel_to_test"], LICENSE_SUFFIX)
+    except Exception as e:
+        # Never upload a wheel without its license files; the repair itself
+        # succeeded, so this is not a FAILED wheel for source rebuilds
+        job["audit_status"] = "LICENSE_FAILED"
+        job["audit_msg"] = f"license stage failed: {e}"
+        job["upload"] = False
+        job["done"] = True
+        SUMMARY.inc("license_failed")
+        SUMMARY.inc("pip_skipped")
+        return job
+    finally:
+        job["timings"]["license_seconds"] = time.monotonic() - t
+
+    SUMMARY.inc("license_applied")
+    return job
+
+
+def stage_pip_test(job):
+    """Pipeline stage: pip install the wheel into a pooled venv."""
+    py_tag = job["py_tag"]
+    if py_tag not in PYTHON_BIN_MAP:
+        return job
+
+    t = time.monotonic()
+    with VENV_POOL.checkout(py_tag) as venv:
+        r = pip_install(venv, job["wheel_to_test"])
+    job["timings"]["pip_seconds"] = time.monotonic() - t
+
+    if r.returncode == 0:
+        job["pip_status"] = "SUCCESS"
+        SUMMARY.inc("pip_success")
+        # Repaired native wheels are only uploaded once they install
+        job["upload"] = True
+    else:
+        job["pip_status"] = "FAILED"
+        job["pip_msg"] = r.stderr.strip().splitlines()[-1]
+        SUMMARY.inc("pip_failed")
+    return job
+
+
+def stage_upload(job):
+    """Pipeline stage: upload the wheel to Artifactory when it qualified."""
+    if job["upload"]:
+        t = time.monotonic()
+        upload(job["wheel_to_test"], job["pkg"], job["ver"])
+        job["timings"]["upload_seconds"] = time.monotonic() - t
+    return job
+
+
+def finish_wheel(job):
+    """Remove a wheel's local files and return its result row."""
+    for f in {job["wheel"], job["wheel_to_test"]}:
         try:
             if f and os.path.exists(f):
                 os.remove(f)
         except Exception:
             pass
+    if job.get("repair_dir"):
+        shutil.rmtree(job["repair_dir"], ignore_errors=True)
 
-    return name, audit_status, audit_msg, pip_status, pip_msg, bundled_libs
+    for key, seconds in job["timings"].items():
+        STAGE_SECONDS[key].observe(seconds)
 
+    return (
+        job["name"],
+        job["audit_status"],
+        job["audit_msg"],
+        job["pip_status"],
+        job["pip_msg"],
+        job["bundled_libs"],
+        job["timings"],
+    )
 
 
-def load_already_successful_wheels():
-    """Load already successfully processed wheels from the status CSV."""
-    done = set()
-    path = os.path.join(OUTPUT_DIR, "wheel_status.csv")
-    if not os.path.exists(path):
-        return done
+PIPELINE_STAGES = [stage_repair, stage_license, stage_pip_test, stage_upload]
 
-    with open(path, newline="") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            done.add(row["wheel_path"])
 
-    return done
+def process_wheel(item):
+    """Process a single wheel: download, auditwheel repair, licenses, pip install, upload."""
+    job = stage_download(item)
+    for stage in PIPELINE_STAGES:
+        if job["done"]:
+            break
+        job = stage(job)
+    return finish_wheel(job)
+
+
+def process_local_wheel(path):
+    """
+    Repair, pip test and upload a wheel that is already on local disk (e.g.
+    built from source by source_build_pipeline.py). path itself is left in
+    place; the stages work on a link to it in DOWNLOAD_DIR.
+    """
+    SUMMARY.inc("total")
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    wheel = os.path.join(DOWNLOAD_DIR, os.path.basename(path))
+    if os.path.exists(wheel):
+        os.remove(wheel)
+    try:
+        os.link(path, wheel)
+    except OSError:
+        shutil.copyfile(path, wheel)
+
+    job = new_job(wheel, {})
+    for stage in PIPELINE_STAGES:
+        if job["done"]:
+            break
+        job = stage(job)
+    return finish_wheel(job)
+
+
+class StagedPipeline:
+    """
+    Bounded-queue pipeline with a separate worker pool per stage.
+
+    stages is a list of (name, func, workers). Jobs flow through the stages in
+    order; a stage hands a job to the next one through a queue of queue_size
+    slots, blocking when it is full, so at most a bounded number of wheels
+    are on disk at any time. A job whose "done" flag is set skips the remaining
+    stages. finish runs on the worker that completes a job and its return value
+    is handed to the consumer of results().
+    """
+
+    def __init__(self, stages, queue_size, finish):
+        self.finish = finish
+        self.stage_names = [name for name, _, _ in stages]
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self._results = queue.Queue()
+        self._stop = threading.Event()
+        self._threads = []
+        for i, (name, func, workers) in enumerate(stages):
+            for n in range(workers):
+                t = threading.Thread(
+                    target=self._worker,
+                    args=(i, func),
+                    name=f"{name}-{n}",
+                    daemon=True,
+                )
+                t.start()
+                self._threads.append(t)
+
+    def _put(self, q, item):
+        """Blocking put that gives up once the pipeline is stopped."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker(self, i, func):
+        last = i == len(self._queues) - 1
+        while not self._stop.is_set():
+            try:
+                job = self._queues[i].get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                job = func(job)
+                if last or job.get("done"):
+                    self._results.put((self.finish(job), None))
+                else:
+                    self._put(self._queues[i + 1], job)
+            except BaseException as e:
+                self._results.put((None, e))
+
+    def queue_depths(self):
+        """Number of jobs waiting in front of each stage."""
+        return {name: q.qsize() for name, q in zip(self.stage_names, self._queues)}
+
+    def submit(self, job):
+        """Queue a job for the first stage, blocking while it is full."""
+        return self._put(self._queues[0], job)
+
+    def get(self, timeout=None):
+        """Return the next finished result; re-raises worker exceptions."""
+        result, err = self._results.get(timeout=timeout)
+        if err is not None:
+            raise err
+        return result
+
+    def close(self):
+        """Stop all workers."""
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+
+
+def load_already_successful_wheels():
+    """Load already processed wheels from the state store."""
+    store = StateStore(OUTPUT_DIR)
+    try:
+        return {row["wheel_path"] for row in store.query()}
+    finally:
+        store.close()
 
 
 def main():
     """Main processing function."""
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-    existing_status = {}
-    status_csv = os.path.join(OUTPUT_DIR, "wheel_status.csv")
+    global REPAIR_ENGINE
+    if AUDITWHEEL_IN_PROCESS:
+        REPAIR_ENGINE = RepairEngine(REPAIR_WORKERS, AUDITWHEEL_LD_LIBRARY_PATH)
+
+    store = StateStore(OUTPUT_DIR)
+    existing_status, existing_all = store.load()
 
-    if os.path.exists(status_csv):
-        with open(status_csv, newline="") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                existing_status[row["wheel_path"]] = row
+    # Wheels held back by the license stage were never uploaded: retry them
+    license_retries = 0
+    for name, row in list(existing_status.items()):
+        if row["auditwheel_status"] == "LICENSE_FAILED":
+            del existing_status[name]
+            existing_all.pop(name, None)
+            license_retries += 1
 
     already_processed_count = len(existing_status)
     for row in existing_status.values():
         if row["auditwheel_status"] == "SUCCESS":
-            SUMMARY["audit_success"] += 1
+            SUMMARY.inc("audit_success")
         elif row["auditwheel_status"] == "FAILED":
-            SUMMARY["audit_failed"] += 1
+            SUMMARY.inc("audit_failed")
 
         if row["pip_install_status"] == "SUCCESS":
-            SUMMARY["pip_success"] += 1
+            SUMMARY.inc("pip_success")
         elif row["pip_install_status"] == "FAILED":
-            SUMMARY["pip_failed"] += 1
+            SUMMARY.inc("pip_failed")
         elif row["pip_install_status"] == "SKIPPED":
-            SUMMARY["pip_skipped"] += 1
+            SUMMARY.inc("pip_skipped")
 
         if "no elf" in (row["auditwheel_message"] or "").lower():
-            SUMMARY["no_elf"] += 1
-
-    existing_all = {}
-    existing_ext = {}
-
-    all_csv = os.path.join(OUTPUT_DIR, "native_libs_all.csv")
-    ext_csv = os.path.join(OUTPUT_DIR, "native_libs_external.csv")
-
-    if os.path.exists(all_csv):
-        with open(all_csv, newline="") as f:
-            r = csv.DictReader(f)
-            for row in r:
-                existing_all.setdefault(row["wheel_path"], []).append(
-                    row["native_library"]
-                )
-
-    if os.path.exists(ext_csv):
-        with open(ext_csv, newline="") as f:
-            r = csv.DictReader(f)
-            for row in r:
-                existing_ext.setdefault(row["wheel_path"], []).append(
-                    row["native_library"]
-                )
+            SUMMARY.inc("no_elf")
 
     for wheel, libs in existing_all.items():
         if any(lib != "not found" for lib in libs):
-            SUMMARY["native_repaired"] += 1
-
-    wheels = fetch_wheels()
-    wheels = sorted(wheels, key=lambda w: w["name"])
-
-    to_process = [w for w in wheels if w["name"] not in existing_status]
-
-    print("TOTAL FETCHED:", len(wheels))
-    print("ALREADY PROCESSED (from CSV):", already_processed_count)
-    print("TO PROCESS:", len(to_process))
+            SUMMARY.inc("native_repaired")
 
+    print("ALREADY PROCESSED (from state store):", already_processed_count)
     SUMMARY["already_processed"] = already_processed_count
-    SUMMARY["newly_processed"] = len(to_process)
-    overall_total = SUMMARY["already_processed"] + SUMMARY["newly_processed"]
 
+    # Delta sync: only list artifacts modified since the last complete run
+    mark_key = f"aql_high_water:{SOURCE_REPO}"
+    since = store.get_meta(mark_key) if INCREMENTAL_SYNC else None
+    if since and license_retries:
+        # The mark may already be past them, so they would not be listed
+        print(f"[INFO] {license_retries} wheels to retry after a license failure, listing everything")
+        since = None
+    if since:
+        print("INCREMENTAL SYNC since:", since)
+    high_water = since
+
+    fetched = 0
+    queued = 0
     processed = 0
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
-        futures = [ex.submit(process_wheel, w) for w in to_process]
+    stages = [
+        ("download", stage_download, DOWNLOAD_WORKERS),
+        ("repair", stage_repair, REPAIR_WORKERS),
+        ("pip", stage_pip_test, PIP_WORKERS),
+        ("upload", stage_upload, UPLOAD_WORKERS),
+    ]
+    if LICENSE_SUFFIX:
+        license.set_search_root(LICENSE_SEARCH_ROOT)
+        # Before the pip test, so the tested wheel is the one uploaded
+        stages.insert(2, ("license", stage_license, LICENSE_WORKERS))
+    pipeline = StagedPipeline(stages, STAGE_QUEUE_SIZE, finish_wheel)
+    METRICS.add_gauge("queue_depth", "Wheels waiting in front of each stage.", pipeline.queue_depths)
+    METRICS.add_gauge("listed", "Wheels returned by the AQL listing so far.", lambda: fetched)
+    metrics_server = None
+    metrics_writer = None
+
+    listing_done = threading.Event()
+    listing_error = []
+
+    def feed():
+        """Page through the AQL listing and queue unprocessed wheels."""
+        nonlocal fetched, queued, high_water
+        try:
+            for item in fetch_wheels(since):
+                fetched += 1
+                # AQL timestamps share one ISO-8601 format, so they order as strings
+                stamp = item.get("modified") or item.get("created")
+                if stamp and (high_water is None or stamp > high_water):
+                    high_water = stamp
+                if item["name"] in existing_status:
+                    continue
+                queued += 1
+                # Blocks while the download queue is full (backpressure)
+                if not pipeline.submit(item):
+                    return
+
+            print("TOTAL FETCHED:", fetched)
+            print("TO PROCESS:", queued)
+        except BaseException as e:
+            listing_error.append(e)
+        finally:
+            listing_done.set()
 
-        for f in as_completed(futures):
-            result = f.result()
+    feeder = threading.Thread(target=feed, name="listing", daemon=True)
+    try:
+        if METRICS_PORT:
+            try:
+                metrics_server = METRICS.serve(METRICS_PORT)
+            except OSError as e:
+                # e.g. another run on this host already serves the port
+                print(f"[WARN] Metrics endpoint on port {METRICS_PORT} unavailable: {e}")
+        if METRICS_FILE:
+            metrics_writer = METRICS.start_file_writer(METRICS_FILE, METRICS_FLUSH_SECONDS)
+
+        # Wheels enter the pipeline while the listing is still being paged in
+        feeder.start()
+        while not (listing_done.is_set() and processed == queued):
+            try:
+                result = pipeline.get(timeout=1)
+            except queue.Empty:
+                continue
             processed += 1
 
             processed_so_far = SUMMARY["already_processed"] + processed
+            overall_total = SUMMARY["already_processed"] + queued
             remaining = overall_total - processed_so_far
 
             print(
@@ -436,63 +763,33 @@ def main():
                 flush=True,
             )
 
-            name, a_s, a_m, p_s, p_m, bundled = result
-
-            existing_status[name] = {
-                "wheel_path": name,
-                "auditwheel_status": a_s,
-                "auditwheel_message": a_m,
-                "pip_install_status": p_s,
-                "pip_install_message": p_m,
-            }
-
-            existing_all[name] = []
-            existing_ext[name] = []
-
-            if bundled:
-                for so in bundled:
-                    existing_all[name].append(so)
-                    existing_ext[name].append(so)
-            else:
-                existing_all[name].append("not found")
-                existing_ext[name].append("not found")
-
-            with open(status_csv, "w", newline="") as fw:
-                w = csv.writer(fw)
-                w.writerow(
-                    [
-                        "wheel_path",
-                        "auditwheel_status",
-                        "auditwheel_message",
-                        "pip_install_status",
-                        "pip_install_message",
-                    ]
-                )
-                for row in existing_status.values():
-                    w.writerow(
-                        [
-                            row["wheel_path"],
-                            row["auditwheel_status"],
-                            row["auditwheel_message"],
-                            row["pip_install_status"],
-                            row["pip_install_message"],
-                        ]
-                    )
-
-            """ Update all libs CSVs """
-            with open(all_csv, "w", newline="") as fw:
-                w = csv.writer(fw)
-                w.writerow(["wheel_path", "native_library"])
-                for wheel, libs in existing_all.items():
-                    for lib in libs:
-                        w.writerow([wheel, lib])
-            """ Update bundled libs CSVs """
-            with open(ext_csv, "w", newline="") as fw:
-                w = csv.writer(fw)
-                w.writerow(["wheel_path", "native_library"])
-                for wheel, libs in existing_ext.items():
-                    for lib in libs:
-                        w.writerow([wheel, lib])
+            store.upsert(*result)
+
+        if listing_error:
+            raise listing_error[0]
+
+        # Only advance the mark after a complete, untruncated listing
+        # whose wheels all finished.
+        listing_complete = not MAX_TOTAL_WHEELS or fetched < MAX_TOTAL_WHEELS
+        if INCREMENTAL_SYNC and listing_complete and high_water:
+            store.set_meta(mark_key, high_water)
+    finally:
+        pipeline.close()
+        if feeder.is_alive():
+            feeder.join()
+        VENV_POOL.close()
+        if REPAIR_ENGINE is not None:
+            REPAIR_ENGINE.close()
+        store.export_csv()
+        store.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        if metrics_writer is not None:
+            metrics_writer.set()
+            METRICS.write_file(METRICS_FILE)
+
+    SUMMARY["newly_processed"] = queued
+    overall_total = SUMMARY["already_processed"] + SUMMARY["newly_processed"]
 
     print("\n===== SUMMARY =====")
     print(f"overall_total: {overall_total}")
@@ -0,0 +1,250 @@
+"""
+Streaming command runner for long container builds.
+
+Builds such as scipy or pyarrow print hundreds of MB of output. Instead of
+buffering stdout/stderr until the process exits, output is read line by line
+as it is produced, written to a gzip-compressed log file, and only the last
+few lines are kept in memory for the failure report. While the build runs, a
+progress line with the elapsed time and the latest output is printed
+periodically, so a stuck build is visible as it happens.
+
+Builds can be bounded by a wall-clock and an idle-output timeout and
+cancelled from another thread. The build runs in its own process group, which
+is killed as a whole, and the containers it started are removed. Containers
+started through the `docker` CLI get their limits and a label from a wrapper
+(see install_docker_shim); containers started through the docker API (e.g.
+the docker Python SDK) bypass it and are found instead by their bind mounts
+of the build's workspace, then limited with `docker update` (see
+BuildContainers).
+"""
+
+import os
+import gzip
+import time
+import signal
+import shutil
+import threading
+import subprocess
+from collections import deque
+
+# Longest chunk read at once, so a huge line without newline stays bounded
+MAX_LINE_BYTES = 64 * 1024
+# Seconds between SIGTERM and SIGKILL when stopping a build
+KILL_GRACE_SECONDS = 10
+# Seconds between looks for new containers of a running build
+CONTAINER_POLL_SECONDS = 15
+CONTAINER_LABEL = "wheel-build-id"
+
+# Prepended to PATH for builds: every container a build starts gets the
+# per-build resource limits and a label identifying the build. Options given
+# by the build itself come later on the command line and win.
+DOCKER_SHIM = """#!/bin/sh
+limits="--label $WHEEL_BUILD_LABEL --cpus $WHEEL_BUILD_CPUS --memory $WHEEL_BUILD_MEMORY"
+case "$1" in
+    run|create)
+        sub="$1"; shift
+        exec "$WHEEL_BUILD_DOCKER" "$sub" $limits "$@" ;;
+    container)
+        case "$2" in
+            run|create)
+                sub="$2"; shift 2
+                exec "$WHEEL_BUILD_DOCKER" container "$sub" $limits "$@" ;;
+        esac ;;
+esac
+exec "$WHEEL_BUILD_DOCKER" "$@"
+"""
+
+
+def install_docker_shim(bin_dir):
+    """Write the docker wrapper into bin_dir; returns the real docker path (None if absent)."""
+    real = shutil.which("docker")
+    if real is None:
+        return None
+    os.makedirs(bin_dir, exist_ok=True)
+    path = os.path.join(bin_dir, "docker")
+    with open(path, "w") as f:
+        f.write(DOCKER_SHIM)
+    os.chmod(path, 0o755)
+    return real
+
+
+def container_env(env, shim_dir, real_docker, build_id, cpus, memory_mb):
+    """Environment that routes a build's docker calls through the wrapper."""
+    env = dict(env)
+    if real_docker is None:
+        return env
+    env["PATH"] = shim_dir + os.pathsep + env.get("PATH", "")
+    env["WHEEL_BUILD_DOCKER"] = real_docker
+    env["WHEEL_BUILD_LABEL"] = f"{CONTAINER_LABEL}={build_id}"
+    env["WHEEL_BUILD_CPUS"] = f"{cpus:g}"
+    env["WHEEL_BUILD_MEMORY"] = f"{int(memory_mb)}m"
+    return env
+
+
+def _docker(args):
+    return subprocess.run(
+        ["docker"] + list(args),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+
+
+class BuildContainers:
+    """
+    Containers of one build: labelled with build_id by the docker wrapper, or
+    bind-mounting a path under mount_root (the build's workspace). Containers
+    present before the build started are never touched.
+    """
+
+    def __init__(self, build_id, mount_root, cpus, memory_mb, poll_seconds=CONTAINER_POLL_SECONDS):
+        self.build_id = build_id
+        self.mount_root = os.path.realpath(mount_root)
+        self.cpus = cpus
+        self.memory_mb = int(memory_mb)
+        self.poll_seconds = poll_seconds
+        self.seen = set()
+        self._last_poll = 0.0
+        self._ignore = set(self._find())
+
+    def _mounted(self, source):
+        source = os.path.realpath(source)
+        return source == self.mount_root or source.startswith(self.mount_root + os.sep)
+
+    def _find(self):
+        """Map container id -> True if labelled by the wrapper, for this build."""
+        ids = _docker(["ps", "-aq", "--no-trunc"]).stdout.split()
+        if not ids:
+            return {}
+        fmt = (
+            "{{.Id}}\t{{index .Config.Labels \"" + CONTAINER_LABEL + "\"}}\t"
+            "{{range .Mounts}}{{.Source}}|{{end}}"
+        )
+        # Containers gone since `docker ps` make inspect fail, the rest is printed
+        found = {}
+        for line in _docker(["inspect", "--format", fmt] + ids).stdout.splitlines():
+            cid, _, rest = line.partition("\t")
+            label, _, mounts = rest.partition("\t")
+            if label == self.build_id:
+                found[cid] = True
+            elif any(self._mounted(m) for m in mounts.split("|") if m):
+                found[cid] = False
+        return found
+
+    def poll(self, force=False):
+        """Look for new containers and apply the limits to those the wrapper missed."""
+        now = time.monotonic()
+        if not force and now - self._last_poll < self.poll_seconds:
+            return self.seen
+        self._last_poll = now
+        for cid, labelled in self._find().items():
+            if cid in self._ignore or cid in self.seen:
+                continue
+            self.seen.add(cid)
+            if not labelled:
+                _docker([
+                    "update",
+                    "--cpus", f"{self.cpus:g}",
+                    "--memory", f"{self.memory_mb}m",
+                    "--memory-swap", f"{2 * self.memory_mb}m",
+                    cid,
+                ])
+        return self.seen
+
+    def kill(self):
+        """Force-remove every container of the build; returns their ids."""
+        ids = sorted(self.poll(force=True))
+        if ids:
+            _docker(["rm", "-f"] + ids)
+        return ids
+
+
+def _terminate(proc):
+    """Stop the process group of proc: SIGTERM, then SIGKILL after a grace period."""
+    for sig, wait in ((signal.SIGTERM, KILL_GRACE_SECONDS), (signal.SIGKILL, None)):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            proc.wait(timeout=wait)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def run_streaming(cmd, log_path, say, cwd=None, env=None, tail_lines=200, progress_seconds=60,
+                  timeout=None, idle_timeout=None, cancel=None, on_cancel=None, on_poll=None):
+    """
+    Run cmd with stdout and stderr merged into log_path (gzip).
+
+    say is called with a progress message every progress_seconds. The build
+    is stopped after timeout seconds in total, after idle_timeout seconds
+    without output, or once the cancel Event is set; on_cancel is then called
+    (e.g. to remove its containers). on_poll is called about once a second
+    while the build runs. Returns a subprocess.CompletedProcess
+    whose stdout holds the last tail_lines lines and whose stderr holds the
+    reason the build was stopped ("" when it exited on its own).
+    """
+    proc = subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        start_new_session=True,
+    )
+    tail = deque(maxlen=tail_lines)
+    start = time.monotonic()
+    counts = {"lines": 0, "bytes": 0, "last_output": start}
+
+    def pump():
+        with gzip.open(log_path, "wb") as log:
+            for raw in iter(lambda: proc.stdout.readline(MAX_LINE_BYTES), b""):
+                log.write(raw)
+                tail.append(raw.decode("utf-8", "replace").rstrip("\r\n"))
+                counts["lines"] += 1
+                counts["bytes"] += len(raw)
+                counts["last_output"] = time.monotonic()
+
+    reader = threading.Thread(target=pump, name="build-log", daemon=True)
+    reader.start()
+
+    reason = ""
+    last_progress = start
+    while True:
+        try:
+            proc.wait(timeout=1)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+
+        if on_poll is not None:
+            on_poll()
+        now = time.monotonic()
+        if timeout and now - start > timeout:
+            reason = f"wall-clock timeout after {timeout}s"
+        elif idle_timeout and now - counts["last_output"] > idle_timeout:
+            reason = f"no output for {idle_timeout}s"
+        elif cancel is not None and cancel.is_set():
+            reason = "cancelled"
+        if reason:
+            say(f"[CANCEL] {reason}, stopping build")
+            _terminate(proc)
+            if on_cancel is not None:
+                on_cancel()
+            break
+
+        if now - last_progress >= progress_seconds:
+            last_progress = now
+            last = tail[-1][:160] if tail else ""
+            say(
+                f"[PROGRESS] {int(now - start)}s elapsed, "
+                f"{counts['lines']} lines ({counts['bytes'] // 1024} KiB) logged | {last}"
+            )
+
+    # A stray process outside the group could keep the pipe open
+    reader.join(timeout=60 if reason else None)
+    proc.stdout.close()
+    return subprocess.CompletedProcess(cmd, proc.returncode, "\n".join(tail) + "\n", reason)
@@ -0,0 +1,137 @@
+"""
+Managed checkout of the ppc64le/build-scripts repository.
+
+The repository is cloned shallow (a single commit of a single branch) and
+later runs only fetch the delta to the current tip, or to the exact commit the
+checkout is pinned to. The origin may be a local mirror, so runs also work
+offline; when a fetch fails the checkout stays on the commit recorded by the
+previous run. Script locations are indexed from `git ls-tree` once per commit
+and cached, instead of walking the whole tree for every lookup.
+"""
+
+import os
+import json
+import shutil
+import subprocess
+
+
+def _is_local(url):
+    return "://" not in url and os.path.isdir(url)
+
+
+class BuildScriptsCheckout:
+    """Shallow, incrementally updated clone of build-scripts with a script index."""
+
+    def __init__(self, path, url, ref=None, pin=None, update=True, index_cache=None):
+        self.path = path
+        # --depth is ignored for plain local paths, file:// keeps clones shallow
+        self.url = f"file://{os.path.abspath(url)}" if _is_local(url) else url
+        self.ref = ref
+        self.pin = pin
+        self.update = update
+        self.index_cache = index_cache
+        self.commit = None
+        self._index = None
+
+    def _git(self, *args, cwd=None):
+        return subprocess.run(
+            ["git"] + list(args),
+            cwd=cwd or self.path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+
+    def _head(self):
+        r = self._git("rev-parse", "HEAD")
+        return r.stdout.strip() if r.returncode == 0 else None
+
+    def _has_commit(self, sha):
+        return self._git("cat-file", "-e", f"{sha}^{{commit}}").returncode == 0
+
+    def _fetch(self, what):
+        """Shallow fetch of a ref or commit; returns the fetched commit or None."""
+        r = self._git("fetch", "--depth", "1", "origin", what)
+        if r.returncode != 0:
+            print(f"[WARN] git fetch {what} failed: {r.stderr.strip()}")
+            return None
+        return self._git("rev-parse", "FETCH_HEAD").stdout.strip()
+
+    def _clone(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        cmd = ["clone", "--depth", "1", "--single-branch"]
+        if self.ref:
+            cmd += ["--branch", self.ref]
+        r = self._git(*cmd, self.url, self.path, cwd=os.path.dirname(os.path.abspath(self.path)))
+        if r.returncode != 0:
+            raise RuntimeError(f"Failed to clone {self.url}: {r.stderr.strip()}")
+
+    def ensure(self):
+        """Clone or update the checkout; returns the commit it is at."""
+        if not os.path.isdir(os.path.join(self.path, ".git")):
+            print(f"[SETUP] Cloning build-scripts (shallow) from {self.url}")
+            self._clone()
+            fetched = not self.pin
+        else:
+            # The origin may have been switched to or from a mirror
+            self._git("remote", "set-url", "origin", self.url)
+            fetched = False
+
+        target = None
+        if self.pin:
+            if not self._has_commit(self.pin) and self._fetch(self.pin) is None:
+                raise RuntimeError(f"Pinned build-scripts commit {self.pin} is not available")
+            target = self.pin
+        elif self.update and not fetched:
+            target = self._fetch(self.ref or "HEAD")
+            if target is None:
+                print(f"[WARN] Could not update build-scripts, staying at {self._head()}")
+
+        if target and target != self._head():
+            r = self._git("checkout", "-q", "--detach", "--force", target)
+            if r.returncode != 0:
+                raise RuntimeError(f"Failed to check out {target}: {r.stderr.strip()}")
+
+        self.commit = self._head()
+        if not self.commit:
+            raise RuntimeError(f"{self.path} has no usable commit")
+        return self.commit
+
+    def _build_index(self):
+        r = self._git("ls-tree", "-r", "-z", "--name-only", "HEAD")
+        if r.returncode != 0:
+            raise RuntimeError(f"git ls-tree failed: {r.stderr.strip()}")
+        index = {}
+        for rel in sorted(r.stdout.split("\0")):
+            if rel:
+                index.setdefault(os.path.basename(rel), rel)
+        return index
+
+    def index(self):
+        """Map file name -> path relative to the checkout, cached per commit."""
+        if self._index is not None:
+            return self._index
+
+        if self.index_cache and os.path.exists(self.index_cache):
+            try:
+                with open(self.index_cache) as f:
+                    cached = json.load(f)
+                if cached.get("commit") == self.commit:
+                    self._index = cached["scripts"]
+                    return self._index
+            except (OSError, ValueError, KeyError):
+                pass
+
+        self._index = self._build_index()
+        if self.index_cache:
+            os.makedirs(os.path.dirname(self.index_cache) or ".", exist_ok=True)
+            tmp = self.index_cache + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"commit": self.commit, "scripts": self._index}, f)
+            os.replace(tmp, self.index_cache)
+        return self._index
+
+    def find(self, script_name):
+        """Absolute path of a file in the checkout by name, or None."""
+        rel = self.index().get(script_name)
+        return os.path.join(self.path, rel) if rel else None
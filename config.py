@@ -1,3 +1,5 @@
+import os
+
 # ---------------- ARTIFACTORY ----------------
 ART_URL = "https://na.artifactory.swg-devops.com/artifactory"
 JFROG_AQL_URL = "https://na.artifactory.swg-devops.com/artifactory/api/search/aql"
@@ -13,8 +15,31 @@ DOWNLOAD_DIR = "wheels"
 REPAIRED_DIR = "repaired_wheels"
 EXTRACT_DIR = "extracted"
 OUTPUT_DIR = "output"
+BUILT_WHEELS_DIR = "built_wheels"   # wheels produced by source builds
+
+# Content-addressed wheel cache shared between runs (None disables it)
+DOWNLOAD_CACHE_DIR = "wheel_cache"
+DOWNLOAD_CACHE_MAX_BYTES = 50 * 1024 ** 3
+
+# ---------------- STATE STORE ----------------
+STATE_DB_NAME = "wheel_state.db"   # SQLite (WAL) state store inside OUTPUT_DIR
+STATE_SYNC_EVERY = 20              # commit after this many finished wheels
+STATE_SYNC_SECONDS = 30            # ... or after this many seconds
 
 
+# ---------------- AUDITWHEEL ----------------
+AUDITWHEEL_IN_PROCESS = True   # run repairs in a persistent process pool instead of one CLI per wheel
+AUDITWHEEL_LD_LIBRARY_PATH = "/usr/local/lib64:/usr/local/lib"   # lets auditwheel find system libs
+
+# ---------------- LICENSES ----------------
+# Inject bundled licenses and add this local version suffix (e.g. "ubi9") to
+# each wheel before upload, as license.py does. None disables the stage.
+LICENSE_SUFFIX = None
+# Directory searched for the system libraries a wheel bundles, to find the
+# owning RPM or the project's license file (the repair run's working
+# directory only holds zipped wheels).
+LICENSE_SEARCH_ROOT = "/usr"
+
 # ---------------- BASE SYSTEM LIBS ----------------
 BASE_SYSTEM_LIBS = (
     "libc.so",
@@ -30,7 +55,68 @@ BASE_SYSTEM_LIBS = (
 # ---------------- LIMITS ----------------
 MAX_TOTAL_WHEELS = 0   # 0 means no limit
 MAX_WORKERS = 4
+AQL_PAGE_SIZE = 1000   # AQL .limit() per listing request
+
+# ---------------- PIPELINE STAGES ----------------
+DOWNLOAD_WORKERS = MAX_WORKERS * 2               # network bound
+REPAIR_WORKERS = os.cpu_count() or MAX_WORKERS   # CPU bound
+PIP_WORKERS = MAX_WORKERS                        # each holds a pooled venv
+UPLOAD_WORKERS = MAX_WORKERS * 2                 # network bound
+LICENSE_WORKERS = MAX_WORKERS                    # only used when LICENSE_SUFFIX is set
+STAGE_QUEUE_SIZE = MAX_WORKERS                   # wheels waiting between stages, bounds disk use
+
+# ---------------- SOURCE BUILDS ----------------
+BUILD_CPU_BUDGET = os.cpu_count() or MAX_WORKERS   # CPUs shared by all concurrent container builds
+BUILD_MEMORY_BUDGET_GB = 32                        # memory shared by all concurrent container builds
+BUILD_CPUS_PER_JOB = 4
+BUILD_MEMORY_PER_JOB_GB = 8
+# Concurrent builds that fit in both budgets
+BUILD_WORKERS = max(
+    1,
+    min(
+        BUILD_CPU_BUDGET // BUILD_CPUS_PER_JOB,
+        BUILD_MEMORY_BUDGET_GB // BUILD_MEMORY_PER_JOB_GB,
+    ),
+)
+# Per-container limits: each concurrent build gets an equal share of the budget
+BUILD_CONTAINER_CPUS = BUILD_CPU_BUDGET / BUILD_WORKERS
+BUILD_CONTAINER_MEMORY_GB = BUILD_MEMORY_BUDGET_GB / BUILD_WORKERS
+BUILD_TIMEOUT_SECONDS = 4 * 3600        # wall-clock limit per build
+BUILD_IDLE_TIMEOUT_SECONDS = 45 * 60    # limit on time without any build output
+# build-scripts checkout: a local mirror (path or URL) replaces the GitHub
+# origin, e.g. for offline runs; REF None follows the default branch.
+BUILD_SCRIPTS_MIRROR = None
+BUILD_SCRIPTS_REF = None
+BUILD_SCRIPTS_COMMIT = None     # pin builds to this exact commit
+BUILD_SCRIPTS_UPDATE = True     # fetch the latest REF; False stays on the recorded commit
+# Rebuild every FAILED wheel, even when its recorded outcome is still valid
+# (already built, or failed deterministically at the same build-scripts commit)
+SOURCE_BUILD_FORCE = False
+# Repair, pip test and upload built wheels in the same run (auditwheel-repair.py stages)
+SOURCE_BUILD_REPAIR = True
+BUILD_LOG_DIR = os.path.join(OUTPUT_DIR, "build_logs")   # one gzip log per source build
+BUILD_LOG_TAIL_LINES = 200     # last lines kept in memory and printed on failure
+BUILD_PROGRESS_SECONDS = 60    # interval of live progress lines while a build runs
 
 REPROCESS_FAILED_PACKAGES = ["numpy"]
 
 REPROCESS_ALL = False
+
+# Only list artifacts modified since the last complete run. When on, wheels
+# removed from the state store are only listed again once they change in
+# Artifactory.
+INCREMENTAL_SYNC = False
+
+# Pre-warmed venvs kept per interpreter for pip install tests
+VENV_POOL_SIZE = PIP_WORKERS
+
+# ---------------- HTTP ----------------
+HTTP_POOL_SIZE = DOWNLOAD_WORKERS + UPLOAD_WORKERS   # keep-alive connections shared by all workers
+HTTP_RETRIES = 5               # retries on connection errors and 429/5xx
+HTTP_BACKOFF = 1.0             # exponential backoff factor (seconds)
+HTTP_TIMEOUT = (10, 300)       # (connect, read) timeout in seconds
+
+# ---------------- METRICS ----------------
+METRICS_PORT = 9109                                    # local Prometheus endpoint (None disables; skipped if in use)
+METRICS_FILE = os.path.join(OUTPUT_DIR, "metrics.prom")   # periodically rewritten (None disables)
+METRICS_FLUSH_SECONDS = 15
@@ -0,0 +1,145 @@
+"""
+Content-addressed cache for wheels downloaded from Artifactory.
+
+Objects are stored as <root>/objects/<sha256[:2]>/<sha256>, keyed by the
+checksum AQL returns for each artifact. Every hit is re-hashed before use,
+entries are written via a temp file and an atomic rename, and eviction takes
+an flock on <root>/.lock, so several runs (or machines on a shared
+filesystem) can use one cache directory. Least recently used objects are
+evicted once the cache grows beyond its size cap.
+"""
+
+import os
+import fcntl
+import shutil
+import hashlib
+import threading
+
+
+def sha256_file(path):
+    """Hex sha256 of a file."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _link_or_copy(src, dst):
+    """Hardlink src to dst, copying when they live on different filesystems."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class DownloadCache:
+    """LRU, size-capped, sha256-addressed file cache."""
+
+    # Re-scan the cache size after this many inserts to account for
+    # objects added by other processes sharing the directory.
+    RESCAN_EVERY = 100
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects = os.path.join(root, "objects")
+        os.makedirs(self.objects, exist_ok=True)
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._bytes = None   # scanned on first insert
+
+    def _path(self, sha256):
+        return os.path.join(self.objects, sha256[:2], sha256)
+
+    def _entries(self):
+        for d in os.scandir(self.objects):
+            if not d.is_dir():
+                continue
+            for e in os.scandir(d.path):
+                if e.is_file() and not e.name.startswith("."):
+                    yield e
+
+    def _scan_size(self):
+        return sum(e.stat().st_size for e in self._entries())
+
+    def get(self, sha256, dest):
+        """Materialize the cached object at dest. Returns False on a miss."""
+        sha256 = sha256.lower()
+        path = self._path(sha256)
+        if not os.path.exists(path):
+            return False
+
+        if sha256_file(path) != sha256:
+            print(f"[WARN] Corrupt cache entry removed: {path}")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return False
+
+        try:
+            _link_or_copy(path, dest)
+            # Mark as recently used for LRU eviction
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted concurrently by another process
+            return False
+        return True
+
+    def put(self, sha256, src):
+        """Add src to the cache under sha256 (which the caller has verified)."""
+        sha256 = sha256.lower()
+        path = self._path(sha256)
+        if os.path.exists(path):
+            os.utime(path)
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = os.path.join(
+            os.path.dirname(path),
+            f".{sha256}.{os.getpid()}.{threading.get_ident()}.tmp",
+        )
+        try:
+            _link_or_copy(src, tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self._scan_size()
+            else:
+                self._bytes += os.path.getsize(path)
+            self._puts += 1
+            rescan = self._puts % self.RESCAN_EVERY == 0
+        if rescan or self._bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used objects until the cache fits its cap."""
+        with open(os.path.join(self.root, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                entries = []
+                for e in self._entries():
+                    try:
+                        st = e.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, e.path))
+                total = sum(size for _, size, _ in entries)
+                for _, size, path in sorted(entries):
+                    if total <= self.max_bytes:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        with self._lock:
+            self._bytes = total
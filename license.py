@@ -4,6 +4,10 @@ Optimized Merged Wheel License Extraction and Version Suffix Script
 This script extracts license information from .so files in a wheel,
 updates the bundled and UBI license files, updates the RECORD, and
 then suffixes the wheel version. The wheel is unpacked and packed only once.
+
+Many wheels can be processed in one run with a worker pool:
+
+    python license.py --batch <suffix> <dir|glob|manifest|wheel>... [--workers N] [--report results.json]
 """
 
 import os
@@ -15,10 +19,49 @@ import sys
 import hashlib
 import base64
 import json
+import csv
+import io
+import struct
+import zipfile
+import posixpath
+import threading
+import glob
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 # License extraction utilities
 LICENSE_PATTERN = re.compile(r"^(LICENSE|COPYING)(\..*)?$")
 LICENSE_SEPARATOR = "----"  # Hardcoded separator for both files
 
+# Soname index persisted between runs; directories are re-listed only when
+# their inode or mtime changed since the cached scan.
+SONAME_INDEX_CACHE = os.environ.get(
+    "SONAME_INDEX_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "wheel-license", "soname_index.json"),
+)
+# Where libraries are searched for; the current directory unless set
+SONAME_SEARCH_ROOT = os.environ.get("LICENSE_SEARCH_ROOT", ".")
+_soname_index = None
+_soname_index_lock = threading.Lock()
+
+# File -> package and package -> license answers persisted between runs,
+# valid for as long as the rpmdb itself is unchanged.
+RPM_CACHE = os.environ.get(
+    "RPM_LICENSE_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "wheel-license", "rpm_cache.json"),
+)
+RPMDB_FILES = (
+    "/var/lib/rpm/rpmdb.sqlite",
+    "/var/lib/rpm/Packages",
+    "/usr/lib/sysimage/rpm/rpmdb.sqlite",
+)
+RPM_NVRA = "%{NAME}-%{VERSION}-%{RELEASE}.%{ARCH}"
+# Inside a [...] array iterator, scalar tags must be repeated with %{=TAG}
+RPM_NVRA_REPEAT = "%{=NAME}-%{=VERSION}-%{=RELEASE}.%{=ARCH}"
+_rpm_resolver = None
+_rpm_resolver_lock = threading.Lock()
+
 def run_command(cmd):
     return subprocess.run(
         cmd,
@@ -46,21 +89,222 @@ def collect_so_files(libs_dir):
 def normalize_so_name(so_name):
     return re.sub(r'-[0-9a-f]{8,}(?=(?:\.so|\.\d))', '', so_name)
 
+def _dir_stamp(path):
+    st = os.lstat(path)
+    return [st.st_ino, st.st_mtime_ns]
+
+def _scan_dir(path):
+    files, dirs = [], []
+    try:
+        with os.scandir(path) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    dirs.append(e.name)
+                elif e.is_file(follow_symlinks=False) and ".so" in e.name:
+                    files.append(e.name)
+    except OSError:
+        pass
+    return files, dirs
+
+def _load_json_cache(cache_path):
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_json_cache(cache_path, cache):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(tmp, cache_path)
+    except OSError as e:
+        print(f"[WARN] Could not save cache {cache_path}: {e}")
+
+def build_soname_index(root=".", cache_path=SONAME_INDEX_CACHE):
+    # Maps file name -> paths (as `find root -type f -name ...` prints them)
+    cache = _load_json_cache(cache_path) if cache_path else {}
+    key = os.path.abspath(root)
+    cached_dirs = cache.get(key, {})
+    dirs = {}
+    changed = False
+
+    stack = [root]
+    while stack:
+        d = stack.pop()
+        try:
+            stamp = _dir_stamp(d)
+        except OSError:
+            continue
+        entry = cached_dirs.get(d)
+        if entry is None or entry["stamp"] != stamp:
+            files, subdirs = _scan_dir(d)
+            entry = {"stamp": stamp, "files": files, "dirs": subdirs}
+            changed = True
+        dirs[d] = entry
+        stack.extend(os.path.join(d, sub) for sub in reversed(entry["dirs"]))
+
+    if cache_path and (changed or len(dirs) != len(cached_dirs)):
+        cache[key] = dirs
+        _save_json_cache(cache_path, cache)
+
+    index = {}
+    for d, entry in dirs.items():
+        for name in entry["files"]:
+            index.setdefault(name, []).append(os.path.join(d, name))
+    return index
+
+def set_search_root(root):
+    global SONAME_SEARCH_ROOT, _soname_index
+    with _soname_index_lock:
+        if root != SONAME_SEARCH_ROOT:
+            SONAME_SEARCH_ROOT = root
+            _soname_index = None
+
+def get_soname_index():
+    global _soname_index
+    with _soname_index_lock:
+        if _soname_index is None:
+            _soname_index = build_soname_index(SONAME_SEARCH_ROOT)
+        return _soname_index
+
 def find_all_so_anywhere(so_name):
-    result = run_command(["find", ".", "-type", "f", "-name", so_name])
-    return result.stdout.strip().splitlines()
+    return list(get_soname_index().get(so_name, []))
+
+def rpmdb_state():
+    state = []
+    for path in RPMDB_FILES:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        state.append([path, st.st_ino, st.st_mtime_ns, st.st_size])
+    return state or None
+
+class RpmResolver:
+    # The rpmdb is read at most once per process (two rpm calls in total,
+    # instead of `rpm -qf` + `rpm -q` per library) and only on a cache miss.
+
+    def __init__(self, cache_path=RPM_CACHE):
+        self.cache_path = cache_path
+        self.state = rpmdb_state()
+        self.files = {}
+        self.licenses = {}
+        self.dirty = False
+        self._db_files = None
+        self._db_licenses = None
+        self._db_ok = False
+        self._lock = threading.Lock()
+
+        cached = _load_json_cache(cache_path) if cache_path and self.state else {}
+        if cached.get("state") == self.state:
+            self.files = cached.get("files", {})
+            self.licenses = cached.get("licenses", {})
+
+    def _query(self, qf):
+        result = run_command(["rpm", "-qa", "--qf", qf])
+        if result.returncode != 0:
+            raise RuntimeError(f"rpm -qa exited with {result.returncode}")
+        return result.stdout.splitlines()
+
+    def _load_rpmdb(self):
+        if self._db_files is not None:
+            return
+        self._db_files = {}
+        self._db_licenses = {}
+        try:
+            files = {}
+            for line in self._query(f"[%{{FILENAMES}}\t{RPM_NVRA_REPEAT}\n]"):
+                path, _, pkg = line.rpartition("\t")
+                # First owner wins, like the first line of `rpm -qf`
+                files.setdefault(path, pkg)
+            licenses = {}
+            for line in self._query(f"{RPM_NVRA}\t%{{LICENSE}}\n"):
+                pkg, _, license_text = line.partition("\t")
+                licenses[pkg] = license_text
+        except (OSError, RuntimeError) as e:
+            # Answers from a failed dump would be cached as "no package"
+            print(f"[WARN] rpmdb dump failed, falling back to per-file rpm queries: {e}")
+            return
+        self._db_files = files
+        self._db_licenses = licenses
+        self._db_ok = True
+
+    def _package_fallback(self, candidates):
+        for path in candidates:
+            result = run_command(["rpm", "-qf", path])
+            if result.returncode == 0:
+                return result.stdout.splitlines()[0].strip()
+        return None
+
+    def _license_fallback(self, pkg_name):
+        result = run_command(["rpm", "-q", "--qf", "%{LICENSE}\n", pkg_name])
+        if result.returncode == 0:
+            return result.stdout.strip() or None
+        return None
+
+    def package(self, so_path):
+        candidates = [os.path.abspath(so_path), os.path.realpath(so_path)]
+        with self._lock:
+            for path in candidates:
+                if path in self.files:
+                    return self.files[path]
+            self._load_rpmdb()
+            if not self._db_ok:
+                pkg = self._package_fallback(candidates)
+                if pkg:
+                    self.files[candidates[0]] = pkg
+                    self.dirty = True
+                return pkg
+            pkg = None
+            for path in candidates:
+                pkg = self._db_files.get(path)
+                if pkg:
+                    break
+            self.files[candidates[0]] = pkg
+            self.dirty = True
+            return pkg
+
+    def license(self, pkg_name):
+        with self._lock:
+            if pkg_name in self.licenses:
+                return self.licenses[pkg_name]
+            self._load_rpmdb()
+            if not self._db_ok:
+                license_text = self._license_fallback(pkg_name)
+                if license_text:
+                    self.licenses[pkg_name] = license_text
+                    self.dirty = True
+                return license_text
+            license_text = self._db_licenses.get(pkg_name) or None
+            self.licenses[pkg_name] = license_text
+            self.dirty = True
+            return license_text
+
+    def save(self):
+        with self._lock:
+            if not (self.dirty and self.cache_path and self.state):
+                return
+            _save_json_cache(
+                self.cache_path,
+                {"state": self.state, "files": self.files, "licenses": self.licenses},
+            )
+            self.dirty = False
+
+def get_rpm_resolver():
+    global _rpm_resolver
+    with _rpm_resolver_lock:
+        if _rpm_resolver is None:
+            _rpm_resolver = RpmResolver()
+        return _rpm_resolver
 
 def get_rpm_package(so_path):
-    result = run_command(["rpm", "-qf", so_path])
-    if result.returncode == 0:
-        return result.stdout.strip()
-    return None
+    return get_rpm_resolver().package(so_path)
 
 def get_rpm_license(pkg_name):
-    result = run_command(["rpm", "-q", "--qf", "%{LICENSE}\n", pkg_name])
-    if result.returncode == 0:
-        return result.stdout.strip()
-    return None
+    return get_rpm_resolver().license(pkg_name)
 
 def find_project_root(so_path, max_up=10):
     current = os.path.dirname(so_path)
@@ -86,51 +330,268 @@ def find_dist_info_dir(root):
             return os.path.join(root, item)
     return None
 
+def format_license_entry(existing_text, so_names, license_text):
+    # Text of a license file after appending one entry to existing_text
+    out = [existing_text]
+    if existing_text:
+        out.append(f"\n\n\n{LICENSE_SEPARATOR}\n\n\n\n")
+    out.append(f"Files: {', '.join(so_names)}\n")
+    lines = license_text.strip("\n").splitlines()
+    if len(lines) > 1:
+        out.append("\n")
+        out.append(license_text)
+        if not license_text.endswith("\n"):
+            out.append("\n")
+    else:
+        out.append(f"License: {license_text.strip()}\n")
+    return "".join(out)
+
 def append_license_entry(file_path, so_names, license_text):
-    if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-        with open(file_path, "a", encoding="utf-8") as f:
-            f.write(f"\n\n\n{LICENSE_SEPARATOR}\n\n\n\n")
-
-    with open(file_path, "a", encoding="utf-8") as f:
-        f.write(f"Files: {', '.join(so_names)}\n")
-        lines = license_text.strip("\n").splitlines()
-        if len(lines) > 1:
-            f.write("\n")
-            f.write(license_text)
-            if not license_text.endswith("\n"):
-                f.write("\n")
-        else:
-            f.write(f"License: {license_text.strip()}\n")
+    existing_text = ""
+    if os.path.exists(file_path):
+        with open(file_path, "r", encoding="utf-8") as f:
+            existing_text = f.read()
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(format_license_entry(existing_text, so_names, license_text))
+
+def _record_digest(h):
+    hash_b64 = base64.urlsafe_b64encode(h.digest()).rstrip(b'=').decode("utf-8")
+    return f"sha256={hash_b64}"
 
 def compute_hash_and_size(file_path):
     with open(file_path, "rb") as f:
         data = f.read()
-    digest = hashlib.sha256(data).digest()
-    hash_b64 = base64.urlsafe_b64encode(digest).rstrip(b'=').decode("utf-8")
-    size = len(data)
-    return f"sha256={hash_b64}", size
-
-def update_record(dist_info_dir, file_paths):
-    record_file = os.path.join(dist_info_dir, "RECORD")
-    if not os.path.exists(record_file):
-        print(f"[WARN] RECORD file not found at {record_file}")
-        return
+    return _record_digest(hashlib.sha256(data)), len(data)
 
-    with open(record_file, "r", encoding="utf-8") as f:
-        lines = f.read().splitlines()
+def read_record(dist_info_dir):
+    # arcname -> (hash, size) as listed in the wheel's RECORD
+    record = {}
+    record_path = os.path.join(dist_info_dir, "RECORD")
+    if not os.path.exists(record_path):
+        print(f"[WARN] RECORD file not found at {record_path}")
+        return record
+    with open(record_path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) >= 3 and row[1]:
+                record[row[0]] = (row[1], row[2])
+    return record
+
+def _write_hashed(zf, full_path, arcname):
+    # Compress and hash in the same single read of the file
+    zinfo = zipfile.ZipInfo.from_file(full_path, arcname)
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    h = hashlib.sha256()
+    size = 0
+    with open(full_path, "rb") as src, zf.open(
+        zinfo, "w", force_zip64=zinfo.file_size >= zipfile.ZIP64_LIMIT
+    ) as dst:
+        for chunk in iter(lambda: src.read(1024 * 1024), b""):
+            h.update(chunk)
+            dst.write(chunk)
+            size += len(chunk)
+    return _record_digest(h), size
+
+def pack_wheel(extract_path, dist_info_dir, wheel_path, original_record, old_dist_info, modified):
+    # RECORD is built once here: untouched files reuse the hashes of the
+    # original RECORD, only files in `modified` (or unknown to it) are hashed.
+    new_dist_info = os.path.basename(dist_info_dir)
+    record_arcname = f"{new_dist_info}/RECORD"
+
+    files = []
+    deferred = []
+    for root, dirnames, filenames in os.walk(extract_path):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            full_path = os.path.join(root, fname)
+            arcname = os.path.relpath(full_path, extract_path).replace(os.sep, "/")
+            if arcname == record_arcname:
+                continue
+            # .dist-info goes last, like `wheel pack`
+            if arcname.startswith(f"{new_dist_info}/"):
+                deferred.append((full_path, arcname))
+            else:
+                files.append((full_path, arcname))
 
-    record_map = {line.split(",")[0]: line.split(",") for line in lines}
+    records = []
+    with zipfile.ZipFile(wheel_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for full_path, arcname in files + deferred:
+            original_arcname = arcname
+            if arcname.startswith(f"{new_dist_info}/"):
+                original_arcname = old_dist_info + arcname[len(new_dist_info):]
+
+            if arcname not in modified and original_arcname in original_record:
+                zf.write(full_path, arcname)
+                digest, size = original_record[original_arcname]
+            else:
+                digest, size = _write_hashed(zf, full_path, arcname)
+            records.append([arcname, digest, str(size)])
+
+        records.append([record_arcname, "", ""])
+        _write_record(zf, record_arcname, records)
+
+def _write_record(zf, record_arcname, records):
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(records)
+    zf.writestr(record_arcname, buf.getvalue())
+
+def parse_record(text):
+    record = {}
+    for row in csv.reader(io.StringIO(text)):
+        if len(row) >= 3 and row[1]:
+            record[row[0]] = (row[1], row[2])
+    return record
+
+def _copy_member_raw(src, info, dst, arcname):
+    # Copy a member's compressed bytes verbatim under a (possibly new) name,
+    # without decompressing or recompressing it.
+    src.fp.seek(info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, src.fp.read(zipfile.sizeFileHeader))
+    data_offset = (
+        info.header_offset
+        + zipfile.sizeFileHeader
+        + header[zipfile._FH_FILENAME_LENGTH]
+        + header[zipfile._FH_EXTRA_FIELD_LENGTH]
+    )
 
-    for path in file_paths:
-        if not os.path.exists(path):
-            continue
-        relative_path = os.path.relpath(path, os.path.dirname(dist_info_dir))
-        hash_val, size_val = compute_hash_and_size(path)
-        record_map[relative_path] = [relative_path, hash_val, str(size_val)]
+    zinfo = zipfile.ZipInfo(arcname, info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.CRC = info.CRC
+    zinfo.compress_size = info.compress_size
+    zinfo.file_size = info.file_size
+    zinfo.external_attr = info.external_attr
+    zinfo.create_system = info.create_system
+    # Sizes and CRC are known up front, so no trailing data descriptor
+    zinfo.flag_bits = info.flag_bits & ~0x08
+    zip64 = max(zinfo.file_size, zinfo.compress_size) >= zipfile.ZIP64_LIMIT
+
+    with dst._lock:
+        dst._writecheck(zinfo)
+        dst._didModify = True
+        dst.fp.seek(dst.start_dir)
+        zinfo.header_offset = dst.fp.tell()
+        dst.fp.write(zinfo.FileHeader(zip64))
+        src.fp.seek(data_offset)
+        remaining = info.compress_size
+        while remaining:
+            chunk = src.fp.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                raise RuntimeError(f"Truncated member {info.filename}")
+            dst.fp.write(chunk)
+            remaining -= len(chunk)
+        dst.filelist.append(zinfo)
+        dst.NameToInfo[zinfo.filename] = zinfo
+        dst.start_dir = dst.fp.tell()
+
+def _hash_member(src, info):
+    h = hashlib.sha256()
+    with src.open(info) as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return _record_digest(h), info.file_size
+
+def is_bundled_so_member(name):
+    # Same selection as find_libs_dirs() + collect_so_files() on an unpacked tree
+    parent, base = posixpath.split(name)
+    return posixpath.basename(parent).endswith(".libs") and base.startswith("lib") and ".so" in base
+
+def rewrite_wheel(wheel_path, new_wheel_path, suffix):
+    # Zip-to-zip rewrite: unchanged members are copied compressed, the
+    # .dist-info prefix is renamed on the fly and only METADATA, license files,
+    # SBOMs and RECORD are produced in memory. Returns the old version.
+    with zipfile.ZipFile(wheel_path) as src:
+        infos = [i for i in src.infolist() if not i.is_dir()]
+        dist_infos = sorted({
+            i.filename.split("/", 1)[0]
+            for i in infos
+            if i.filename.split("/", 1)[0].endswith(".dist-info")
+        })
+        if not dist_infos:
+            raise RuntimeError(f"No .dist-info directory found in {wheel_path}")
+        old_dist_info = dist_infos[0]
 
-    with open(record_file, "w", encoding="utf-8", newline="\n") as f:
-        for parts in record_map.values():
-            f.write(",".join(parts) + "\n")
+        # License processing
+        rpm_licenses = {}
+        bundled_licenses = {}
+        for info in infos:
+            if is_bundled_so_member(info.filename):
+                process_so_file(info.filename, rpm_licenses, bundled_licenses)
+        get_rpm_resolver().save()
+
+        # Version suffix processing
+        metadata = src.read(f"{old_dist_info}/METADATA").decode("utf-8").splitlines(keepends=True)
+        old_version = version_from_metadata_lines(metadata)
+        new_version = build_new_version(old_version, suffix)
+        if old_version not in old_dist_info:
+            raise RuntimeError("Failed to rename .dist-info directory")
+        new_dist_info = old_dist_info.replace(old_version, new_version)
+
+        def renamed(name):
+            if name.startswith(f"{old_dist_info}/"):
+                return new_dist_info + name[len(old_dist_info):]
+            return name
+
+        replaced = {
+            f"{new_dist_info}/METADATA": "".join(set_metadata_version(metadata, new_version)).encode("utf-8"),
+        }
+        for fname, licenses in (
+            ("UBI_BUNDLED_LICENSES.txt", rpm_licenses),
+            ("BUNDLED_LICENSES.txt", bundled_licenses),
+        ):
+            if not licenses:
+                continue
+            old_name = f"{old_dist_info}/{fname}"
+            text = ""
+            if old_name in src.NameToInfo:
+                text = src.read(old_name).decode("utf-8")
+            for license_text, files in licenses.items():
+                text = format_license_entry(text, files, license_text)
+            replaced[f"{new_dist_info}/{fname}"] = text.encode("utf-8")
+
+        # Sort SBOMs
+        for info in infos:
+            if (
+                info.filename.startswith(f"{old_dist_info}/sboms/")
+                and info.filename.lower().endswith(".json")
+            ):
+                replaced[renamed(info.filename)] = sorted_sbom_bytes(src.read(info))
+
+        record_name = f"{old_dist_info}/RECORD"
+        original_record = {}
+        if record_name in src.NameToInfo:
+            original_record = parse_record(src.read(record_name).decode("utf-8"))
+        else:
+            print(f"[WARN] RECORD file not found in {wheel_path}")
+        new_record_name = renamed(record_name)
+
+        records = []
+        with zipfile.ZipFile(new_wheel_path, "w", compression=zipfile.ZIP_DEFLATED) as dst:
+            for info in infos:
+                arcname = renamed(info.filename)
+                if arcname == new_record_name:
+                    continue
+                if arcname in replaced:
+                    data = replaced.pop(arcname)
+                    dst.writestr(zipfile.ZipInfo(arcname, info.date_time), data, zipfile.ZIP_DEFLATED)
+                    h = hashlib.sha256(data)
+                    records.append([arcname, _record_digest(h), str(len(data))])
+                    continue
+
+                _copy_member_raw(src, info, dst, arcname)
+                if info.filename in original_record:
+                    digest, size = original_record[info.filename]
+                else:
+                    digest, size = _hash_member(src, info)
+                records.append([arcname, digest, str(size)])
+
+            # New license files
+            for arcname, data in replaced.items():
+                dst.writestr(arcname, data, zipfile.ZIP_DEFLATED)
+                records.append([arcname, _record_digest(hashlib.sha256(data)), str(len(data))])
+
+            records.append([new_record_name, "", ""])
+            _write_record(dst, new_record_name, records)
+
+    return old_version
 
 def process_so_file(so_path, rpm_licenses, bundled_licenses):
     original_name = os.path.basename(so_path)
@@ -160,13 +621,16 @@ def process_so_file(so_path, rpm_licenses, bundled_licenses):
     bundled_licenses.setdefault(f"{original_name}_license_not_found", []).append(original_name)
 
 # Wheel version suffix utilities 
+def version_from_metadata_lines(lines):
+    for line in lines:
+        if line.startswith("Version:"):
+            return line.split(":", 1)[1].strip()
+    raise RuntimeError("Version not found in METADATA")
+
 def read_version_from_metadata(dist_info_dir):
     metadata_path = os.path.join(dist_info_dir, "METADATA")
     with open(metadata_path, "r", encoding="utf-8") as f:
-        for line in f:
-            if line.startswith("Version:"):
-                return line.split(":", 1)[1].strip()
-    raise RuntimeError("Version not found in METADATA")
+        return version_from_metadata_lines(f)
 
 def build_new_version(old_version, suffix):
     if "+" in old_version:
@@ -174,16 +638,18 @@ def build_new_version(old_version, suffix):
         return f"{base}+{local}{suffix}"
     return f"{old_version}+{suffix}"
 
+def set_metadata_version(lines, new_version):
+    return [
+        f"Version: {new_version}\n" if line.startswith("Version:") else line
+        for line in lines
+    ]
+
 def update_metadata_version(dist_info_dir, new_version):
     metadata_path = os.path.join(dist_info_dir, "METADATA")
     with open(metadata_path, "r", encoding="utf-8") as f:
         lines = f.readlines()
     with open(metadata_path, "w", encoding="utf-8") as f:
-        for line in lines:
-            if line.startswith("Version:"):
-                f.write(f"Version: {new_version}\n")
-            else:
-                f.write(line)
+        f.writelines(set_metadata_version(lines, new_version))
 
 def rename_dist_info_dir(extract_path, old_version, new_version):
     for entry in os.listdir(extract_path):
@@ -195,34 +661,6 @@ def rename_dist_info_dir(extract_path, old_version, new_version):
             return new_path
     raise RuntimeError("Failed to rename .dist-info directory")
 
-def _hash_file(path):
-    h = hashlib.sha256()
-    with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    return "sha256=" + h.digest().hex()
-
-def regenerate_record(extract_path, dist_info_dir):
-    record_path = os.path.join(dist_info_dir, "RECORD")
-    records = []
-
-    for root, _, files in os.walk(extract_path):
-        for fname in files:
-            full_path = os.path.join(root, fname)
-            rel_path = os.path.relpath(full_path, extract_path)
-            rel_path = rel_path.replace(os.sep, "/")
-
-            if rel_path.endswith("RECORD"):
-                records.append(f"{rel_path},,")
-                continue
-
-            size = os.path.getsize(full_path)
-            digest = _hash_file(full_path)
-            records.append(f"{rel_path},{digest},{size}")
-
-    with open(record_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(records))
-
 def sort_sbom(sbom: dict) -> dict:
     # Sort metadata.tools
     tools = sbom.get("metadata", {}).get("tools")
@@ -245,6 +683,11 @@ def sort_sbom(sbom: dict) -> dict:
     return sbom
 
 
+def sorted_sbom_bytes(data: bytes) -> bytes:
+    sbom = sort_sbom(json.loads(data.decode("utf-8")))
+    return (json.dumps(sbom, indent=2, sort_keys=False) + "\n").encode("utf-8")
+
+
 def sort_sbom_file(path: str):
     with open(path, "r", encoding="utf-8") as f:
         sbom = json.load(f)
@@ -264,8 +707,36 @@ def sort_sbom_file(path: str):
     os.replace(tmp.name, path)
 
 
+def suffixed_wheel_name(wheel_name, old_version, suffix):
+    if "+" in old_version:
+        base, local = old_version.split("+", 1)
+        return wheel_name.replace(f"{base}+{local}", f"{base}+{local}{suffix}", 1)
+    return wheel_name.replace(old_version, f"{old_version}+{suffix}", 1)
+
 # Main processing function
-def process_wheel(wheel_path, suffix):
+def process_wheel(wheel_path, suffix, in_memory=True):
+    if not in_memory:
+        return process_wheel_unpacked(wheel_path, suffix)
+
+    wheel_dir = os.path.dirname(wheel_path)
+    wheel_name = os.path.basename(wheel_path)
+
+    # The new name needs the METADATA version; write to a temporary name first
+    tmp_path = os.path.join(wheel_dir, f".{wheel_name}.{os.getpid()}.tmp")
+    try:
+        old_version = rewrite_wheel(wheel_path, tmp_path, suffix)
+        new_wheel_path = os.path.join(wheel_dir, suffixed_wheel_name(wheel_name, old_version, suffix))
+        os.replace(tmp_path, new_wheel_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if os.path.abspath(new_wheel_path) != os.path.abspath(wheel_path):
+        os.remove(wheel_path)
+    return new_wheel_path
+
+# Unpack-to-disk variant of process_wheel
+def process_wheel_unpacked(wheel_path, suffix):
     wheel_dir = os.path.dirname(wheel_path)
     wheel_name = os.path.basename(wheel_path)
 
@@ -287,9 +758,13 @@ def process_wheel(wheel_path, suffix):
                 so_files = collect_so_files(libs_dir)
                 for so_file in so_files:
                     process_so_file(so_file, rpm_licenses, bundled_licenses)
+            get_rpm_resolver().save()
 
         dist_info = find_dist_info_dir(extract_path)
         if dist_info:
+            original_record = read_record(dist_info)
+            old_dist_info = os.path.basename(dist_info)
+
             ubi_path = os.path.join(dist_info, "UBI_BUNDLED_LICENSES.txt")
             bundled_path = os.path.join(dist_info, "BUNDLED_LICENSES.txt")
 
@@ -298,46 +773,173 @@ def process_wheel(wheel_path, suffix):
             for license_text, files in bundled_licenses.items():
                 append_license_entry(bundled_path, files, license_text)
 
-            existing_license_files = [p for p in [ubi_path, bundled_path] if os.path.exists(p)]
-            if existing_license_files:
-                update_record(dist_info, existing_license_files)
-
             # Version suffix processing
             old_version = read_version_from_metadata(dist_info)
             new_version = build_new_version(old_version, suffix)
             update_metadata_version(dist_info, new_version)
             dist_info = rename_dist_info_dir(extract_path, old_version, new_version)
-            regenerate_record(extract_path, dist_info)
+            new_dist_info = os.path.basename(dist_info)
+
+            # Files whose RECORD entries must be recomputed
+            modified = {
+                f"{new_dist_info}/METADATA",
+                f"{new_dist_info}/UBI_BUNDLED_LICENSES.txt",
+                f"{new_dist_info}/BUNDLED_LICENSES.txt",
+            }
             # Sort SBOM after version suffix
             for root, _, files in os.walk(extract_path):
                 if root.endswith(os.path.join(".dist-info", "sboms")):
                     for name in files:
                         if name.lower().endswith(".json"):
-                            sort_sbom_file(os.path.join(root, name))
-            # SBOM changed → regenerate RECORD again
-            regenerate_record(extract_path, dist_info)
-        # Pack wheel
-        subprocess.run(["wheel", "pack", extract_path, "-d", wheel_dir], check=True)
+                            sbom_path = os.path.join(root, name)
+                            sort_sbom_file(sbom_path)
+                            modified.add(
+                                os.path.relpath(sbom_path, extract_path).replace(os.sep, "/")
+                            )
 
-    new_wheel_name = wheel_name
-    if "+" in old_version:
-        base, local = old_version.split("+", 1)
-        new_wheel_name = wheel_name.replace(f"{base}+{local}", f"{base}+{local}{suffix}", 1)
-    else:
-        new_wheel_name = wheel_name.replace(old_version, f"{old_version}+{suffix}", 1)
+        new_wheel_path = os.path.join(wheel_dir, suffixed_wheel_name(wheel_name, old_version, suffix))
+
+        # Pack wheel, computing RECORD in the same pass
+        pack_wheel(extract_path, dist_info, new_wheel_path, original_record, old_dist_info, modified)
 
-    new_wheel_path = os.path.join(wheel_dir, new_wheel_name)
     os.remove(wheel_path)
     return new_wheel_path
 
+# Batch mode
+def collect_wheels(inputs):
+    # Each input is a directory, a glob, a .whl path or a manifest file
+    # listing one wheel path per line ("#" starts a comment)
+    wheels = []
+    for item in inputs:
+        if os.path.isdir(item):
+            wheels.extend(sorted(glob.glob(os.path.join(item, "*.whl"))))
+        elif os.path.isfile(item) and not item.endswith(".whl"):
+            base = os.path.dirname(item)
+            with open(item, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.split("#", 1)[0].strip()
+                    if line:
+                        wheels.append(os.path.join(base, line))
+        else:
+            matches = sorted(glob.glob(item))
+            if not matches:
+                print(f"[WARN] No wheels match {item}")
+            wheels.extend(matches)
+
+    seen = set()
+    unique = []
+    for w in wheels:
+        key = os.path.abspath(w)
+        if key not in seen:
+            seen.add(key)
+            unique.append(w)
+    return unique
+
+def _batch_worker_init():
+    # The parent saves the RPM cache once, merged from all workers' answers
+    get_rpm_resolver().cache_path = None
+
+def _batch_process(wheel_path, suffix, in_memory):
+    start = time.monotonic()
+    result = {"wheel": wheel_path, "new_wheel": None, "status": "SUCCESS", "error": None}
+    try:
+        result["new_wheel"] = process_wheel(wheel_path, suffix, in_memory=in_memory)
+    except Exception as e:
+        result["status"] = "FAILED"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = round(time.monotonic() - start, 3)
+    resolver = get_rpm_resolver()
+    return result, resolver.files, resolver.licenses
+
+def process_wheels(wheel_paths, suffix, workers=None, in_memory=True):
+    # The soname index and rpmdb dump are built once here and inherited by
+    # forked workers, so no worker rescans the filesystem or re-runs rpm.
+    get_soname_index()
+    resolver = get_rpm_resolver()
+    with resolver._lock:
+        resolver._load_rpmdb()
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(wheel_paths) or 1))
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_batch_worker_init,
+    ) as pool:
+        futures = [pool.submit(_batch_process, w, suffix, in_memory) for w in wheel_paths]
+        for wheel_path, future in zip(wheel_paths, futures):
+            try:
+                result, files, licenses = future.result()
+            except Exception as e:
+                result = {
+                    "wheel": wheel_path, "new_wheel": None, "status": "FAILED",
+                    "error": f"{type(e).__name__}: {e}", "seconds": None,
+                }
+                files, licenses = {}, {}
+            with resolver._lock:
+                for k, v in files.items():
+                    if k not in resolver.files:
+                        resolver.files[k] = v
+                        resolver.dirty = True
+                for k, v in licenses.items():
+                    if k not in resolver.licenses:
+                        resolver.licenses[k] = v
+                        resolver.dirty = True
+            status = "[INFO]" if result["status"] == "SUCCESS" else "[ERROR]"
+            print(f"{status} {wheel_path}: {result['new_wheel'] or result['error']}")
+            results.append(result)
+
+    resolver.save()
+    return results
+
+def batch_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="license.py --batch",
+        description="Inject licenses and suffix the version of many wheels in parallel.",
+    )
+    parser.add_argument("suffix")
+    parser.add_argument("inputs", nargs="+", help="wheel directories, globs, .whl files or manifest files")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--report", default=None, help="write per-wheel JSON results here instead of stdout")
+    parser.add_argument("--unpack", action="store_true", help="unpack wheels to disk instead of rewriting in memory")
+    args = parser.parse_args(argv)
+
+    wheel_paths = collect_wheels(args.inputs)
+    if not wheel_paths:
+        print("[ERROR] No wheels to process")
+        sys.exit(1)
+    print(f"[INFO] Processing {len(wheel_paths)} wheels")
+
+    results = process_wheels(wheel_paths, args.suffix, args.workers, in_memory=not args.unpack)
+    report = json.dumps(results, indent=2)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+        print(f"[INFO] Results written to {args.report}")
+    else:
+        print(report)
+
+    failed = sum(1 for r in results if r["status"] != "SUCCESS")
+    print(f"[INFO] {len(results) - failed} succeeded, {failed} failed")
+    if failed:
+        sys.exit(1)
+
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: python merged_wheel_script.py <wheel_file.whl> <suffix>")
+    if sys.argv[1:2] == ["--batch"]:
+        batch_main(sys.argv[2:])
+        return
+
+    args = sys.argv[1:]
+    in_memory = "--unpack" not in args
+    args = [a for a in args if a != "--unpack"]
+    if len(args) != 2:
+        print("Usage: python merged_wheel_script.py [--unpack] <wheel_file.whl> <suffix>")
+        print("       python merged_wheel_script.py --batch <suffix> <dir|glob|manifest|wheel>... [--workers N] [--report PATH]")
         sys.exit(1)
 
-    wheel_path = sys.argv[1]
-    suffix = sys.argv[2]
-    new_wheel = process_wheel(wheel_path, suffix)
+    wheel_path = args[0]
+    suffix = args[1]
+    new_wheel = process_wheel(wheel_path, suffix, in_memory=in_memory)
     print(f"[INFO] Wheel updated: {new_wheel}")
 
 if __name__ == "__main__":
@@ -0,0 +1,162 @@
+"""
+Thread-safe run counters and histograms with Prometheus text exposition.
+
+Counters replace bare `dict[key] += 1` updates, which lose increments when
+several pipeline workers hit the same key. A Registry renders everything in
+the Prometheus text format, either served on a local HTTP endpoint or written
+periodically to a file (e.g. for node_exporter's textfile collector).
+"""
+
+import os
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SECONDS_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+BYTES_PER_SECOND_BUCKETS = tuple(2 ** n * 1024 * 1024 for n in range(-4, 10))
+
+
+class Counters:
+    """Named integer counters updated atomically under one lock."""
+
+    def __init__(self, names):
+        self._lock = threading.Lock()
+        self._values = dict.fromkeys(names, 0)
+
+    def inc(self, name, n=1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + n
+
+    def __getitem__(self, name):
+        with self._lock:
+            return self._values[name]
+
+    def __setitem__(self, name, value):
+        with self._lock:
+            self._values[name] = value
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, name, help_text, buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def render(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        cumulative = 0
+        for bound, c in zip(self.buckets, counts):
+            cumulative += c
+            lines.append(f'{self.name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total:g}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+
+class Registry:
+    """Collection of counters, histograms and gauge callbacks for one run."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._counters = []
+        self._histograms = {}
+        self._gauges = []
+
+    def add_counters(self, name, help_text, counters):
+        """Expose a Counters group as one gauge family labelled by key."""
+        self._counters.append((f"{self.prefix}_{name}", help_text, counters))
+        return counters
+
+    def histogram(self, name, help_text, buckets=SECONDS_BUCKETS):
+        full = f"{self.prefix}_{name}"
+        if full not in self._histograms:
+            self._histograms[full] = Histogram(full, help_text, buckets)
+        return self._histograms[full]
+
+    def add_gauge(self, name, help_text, fn):
+        """fn returns a number or a {label_value: number} dict, read at render time."""
+        self._gauges.append((f"{self.prefix}_{name}", help_text, fn))
+
+    def render(self):
+        lines = []
+        for name, help_text, counters in self._counters:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in counters.items():
+                lines.append(f'{name}{{key="{key}"}} {value}')
+        for name, help_text, fn in self._gauges:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            value = fn()
+            if isinstance(value, dict):
+                for label, v in value.items():
+                    lines.append(f'{name}{{key="{label}"}} {v}')
+            else:
+                lines.append(f"{name} {value}")
+        for h in self._histograms.values():
+            lines.extend(h.render())
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve /metrics on a daemon thread; returns the server."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+    def write_file(self, path):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+    def start_file_writer(self, path, interval):
+        """Rewrite path every interval seconds; returns an Event that stops it."""
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                try:
+                    self.write_file(path)
+                except OSError as e:
+                    print(f"[WARN] Failed to write metrics file {path}: {e}")
+
+        threading.Thread(target=loop, name="metrics-file", daemon=True).start()
+        return stop
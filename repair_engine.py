@@ -0,0 +1,124 @@
+"""
+In-process auditwheel repair engine.
+
+Spawning the `auditwheel` CLI for every wheel pays interpreter startup plus
+auditwheel's imports and policy loading each time. RepairEngine keeps a
+persistent process pool whose workers import auditwheel once and then run
+`auditwheel repair` through its Python entry point for each wheel. Results
+are returned as subprocess.CompletedProcess objects carrying the captured
+stdout/stderr, so callers can treat them exactly like the CLI run.
+"""
+
+import io
+import os
+import sys
+import logging
+import threading
+import traceback
+import subprocess
+import multiprocessing
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class _CurrentStderr:
+    """Stream that writes to whatever sys.stderr is at the time of the write."""
+
+    def write(self, s):
+        return sys.stderr.write(s)
+
+    def flush(self):
+        sys.stderr.flush()
+
+
+def _init_worker(ld_library_path):
+    """Process pool initializer: environment, logging and auditwheel imports."""
+    os.environ["LD_LIBRARY_PATH"] = ld_library_path
+
+    # auditwheel calls logging.basicConfig(), which is a no-op once the root
+    # logger has a handler; route its records to the per-call stderr buffer.
+    root = logging.getLogger()
+    root.addHandler(logging.StreamHandler(_CurrentStderr()))
+    root.setLevel(logging.INFO)
+
+    # Load auditwheel, its policies and the ELF tooling once per worker
+    import auditwheel.main  # noqa: F401
+    import auditwheel.policy  # noqa: F401
+    import auditwheel.repair  # noqa: F401
+    import auditwheel.wheel_abi  # noqa: F401
+
+
+def _run_auditwheel(argv):
+    """Run `auditwheel <argv>` in this worker, returning (returncode, stdout, stderr)."""
+    from auditwheel.main import main as auditwheel_main
+
+    out = io.StringIO()
+    err = io.StringIO()
+    saved_argv = sys.argv
+    sys.argv = ["auditwheel"] + list(argv)
+    try:
+        with redirect_stdout(out), redirect_stderr(err):
+            try:
+                rc = auditwheel_main() or 0
+            except SystemExit as e:
+                if isinstance(e.code, int):
+                    rc = e.code
+                else:
+                    if e.code:
+                        print(e.code, file=sys.stderr)
+                    rc = 1
+            except Exception:
+                # Same last line as the CLI's traceback, e.g. "ValueError: ..."
+                traceback.print_exc(file=sys.stderr)
+                rc = 1
+    finally:
+        sys.argv = saved_argv
+    return rc, out.getvalue(), err.getvalue()
+
+
+class RepairEngine:
+    """Persistent pool of auditwheel worker processes."""
+
+    def __init__(self, workers, ld_library_path):
+        self.workers = workers
+        self.ld_library_path = ld_library_path
+        self._lock = threading.Lock()
+        self._pool = self._new_pool()
+
+    def _new_pool(self):
+        # spawn, not fork: the caller is multi-threaded
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.ld_library_path,),
+        )
+
+    def _run_cli(self, argv):
+        env = os.environ.copy()
+        env["LD_LIBRARY_PATH"] = self.ld_library_path
+        return subprocess.run(
+            ["auditwheel"] + list(argv),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            env=env,
+        )
+
+    def run(self, argv):
+        """Run `auditwheel <argv>` in the pool; falls back to the CLI if the pool broke."""
+        pool = self._pool
+        try:
+            rc, out, err = pool.submit(_run_auditwheel, argv).result()
+        except BrokenProcessPool:
+            print("[WARN] auditwheel worker died, restarting pool and using the CLI for this wheel")
+            with self._lock:
+                if self._pool is pool:
+                    pool.shutdown(wait=False)
+                    self._pool = self._new_pool()
+            return self._run_cli(argv)
+        return subprocess.CompletedProcess(["auditwheel"] + list(argv), rc, out, err)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
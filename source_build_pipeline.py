@@ -1,22 +1,82 @@
 import os
-import csv
+import json
+import time
+import uuid
+import shutil
 import subprocess
+import importlib.util
 import tempfile
+import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import (
+    OUTPUT_DIR,
+    BUILT_WHEELS_DIR,
+    SOURCE_BUILD_FORCE,
+    SOURCE_BUILD_REPAIR,
+    PIP_WORKERS,
+    STATE_DB_NAME,
+    BUILD_WORKERS,
+    BUILD_LOG_DIR,
+    BUILD_LOG_TAIL_LINES,
+    BUILD_PROGRESS_SECONDS,
+    BUILD_TIMEOUT_SECONDS,
+    BUILD_IDLE_TIMEOUT_SECONDS,
+    BUILD_CONTAINER_CPUS,
+    BUILD_CONTAINER_MEMORY_GB,
+    BUILD_SCRIPTS_MIRROR,
+    BUILD_SCRIPTS_REF,
+    BUILD_SCRIPTS_COMMIT,
+    BUILD_SCRIPTS_UPDATE,
+)
+from state_store import StateStore
+from workspace_pool import WorkspacePool
+from build_scripts import BuildScriptsCheckout
+from build_runner import run_streaming, install_docker_shim, container_env, BuildContainers
 
 # ---------------- CONFIG ----------------
-CSV_PATH = "output/wheel_status.csv"
+STATE_DB_PATH = os.path.join(OUTPUT_DIR, STATE_DB_NAME)
+CSV_PATH = os.path.join(OUTPUT_DIR, "wheel_status.csv")
 BUILD_SCRIPTS_REPO = "https://github.com/ppc64le/build-scripts.git"
 BUILD_SCRIPTS_DIR = os.path.join(tempfile.gettempdir(), "build-scripts")
 BUILD_WHEELS_SCRIPT = os.path.join(BUILD_SCRIPTS_DIR, "gha-script", "build_wheels.py")
+# File name -> location in build-scripts, valid for one commit
+BUILD_SCRIPTS_INDEX = os.path.join(OUTPUT_DIR, "build_scripts_index.json")
+# One isolated build-scripts tree per concurrent build
+BUILD_WORKSPACES_DIR = os.path.join(tempfile.gettempdir(), "build-scripts-workspaces")
+
+# docker wrapper adding resource limits and a build label to build containers
+DOCKER_SHIM_DIR = os.path.join(tempfile.gettempdir(), "wheel-build-bin")
+
+PRINT_LOCK = threading.Lock()
+# Set to stop all running builds (Ctrl-C); their containers are removed
+CANCEL = threading.Event()
+# Real docker binary behind the wrapper, set in main() (None: no wrapper)
+REAL_DOCKER = None
+# (package, version) -> (BUILD_SCRIPT, IMAGE_NAME), valid for one build-scripts commit
+BUILDINFO_CACHE = os.path.join(OUTPUT_DIR, "buildinfo_cache.json")
+
+# Outcomes that repeat as long as the build-scripts commit is unchanged; a
+# rerun skips them (TIMEOUT, CANCELLED and ERROR are always retried)
+DETERMINISTIC_STATUSES = ("FAIL", "SKIP")
+
+# Runs read_buildinfo.sh and prints both variables from one shell; fails
+# (script output on stderr) unless the script succeeded and wrote variable.sh
+READ_BUILDINFO = (
+    'rm -f variable.sh; bash "$1" >&2 || exit; '
+    '[ -f variable.sh ] || { echo "variable.sh not written" >&2; exit 1; }; '
+    'source ./variable.sh && printf "%s\\n%s\\n" "$BUILD_SCRIPT" "$IMAGE_NAME"'
+)
 
 
 # ---------------- HELPERS ----------------
-def find_script(root_dir, script_name):
-    for root, _, files in os.walk(root_dir):
-        if script_name in files:
-            return os.path.join(root, script_name)
-    return None
+def load_repair_module():
+    """Import auditwheel-repair.py, whose file name is not a valid module name."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "auditwheel-repair.py")
+    spec = importlib.util.spec_from_file_location("auditwheel_repair", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
 
 
 def python_version_from_wheel(wheel_name):
@@ -42,21 +102,352 @@ def run(cmd, cwd=None, env=None):
     )
 
 
+class BuildInfoResolver:
+    """
+    Cached read_buildinfo.sh lookups.
+
+    Python tags of one package version share their build metadata, so each
+    (package, version) is resolved once per build-scripts commit. Results are
+    persisted and reused by later runs until the commit changes.
+    """
+
+    def __init__(self, commit, cache_path=BUILDINFO_CACHE):
+        self.commit = commit
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._key_locks = defaultdict(threading.Lock)
+        self._entries = {}
+
+        if commit and os.path.exists(cache_path):
+            try:
+                with open(cache_path) as f:
+                    cached = json.load(f)
+                if cached.get("commit") == commit:
+                    self._entries = cached.get("entries", {})
+            except (OSError, ValueError) as e:
+                print(f"[WARN] Ignoring build metadata cache {cache_path}: {e}")
+
+    def _read(self, pkg_name, version, workspace, read_buildinfo):
+        env = os.environ.copy()
+        env["PACKAGE_NAME"] = pkg_name
+        env["VERSION"] = version
+        r = run(["bash", "-c", READ_BUILDINFO, "read_buildinfo", read_buildinfo], cwd=workspace, env=env)
+        if r.returncode != 0:
+            # Not cached: a transient failure must not read as "no BUILD_SCRIPT"
+            last = r.stderr.strip().splitlines()[-1] if r.stderr.strip() else ""
+            raise RuntimeError(f"read_buildinfo.sh failed for {pkg_name} {version} (exit {r.returncode}): {last}")
+        lines = r.stdout.splitlines()
+        build_script = lines[0].strip() if lines else ""
+        image_name = lines[1].strip() if len(lines) > 1 else ""
+        if build_script and "/" not in build_script:
+            build_script = f"scripts/{build_script}"
+        return build_script, image_name
+
+    def lookup(self, pkg_name, version, workspace, read_buildinfo):
+        """
+        Return (build_script, image_name); build_script is "" when unknown.
+        Raises RuntimeError when read_buildinfo.sh fails.
+        """
+        key = f"{pkg_name}=={version}"
+        with self._lock:
+            key_lock = self._key_locks[key]
+        # Concurrent python tags of the same version wait for one resolution
+        with key_lock:
+            with self._lock:
+                if key in self._entries:
+                    return tuple(self._entries[key])
+            result = self._read(pkg_name, version, workspace, read_buildinfo)
+            with self._lock:
+                self._entries[key] = list(result)
+            return result
+
+    def save(self):
+        if not self.commit:
+            return
+        with self._lock:
+            data = {"commit": self.commit, "entries": dict(self._entries)}
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp = self.cache_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.cache_path)
+
+
+def in_workspace(path, workspace):
+    """Map a path inside BUILD_SCRIPTS_DIR to the same path inside a workspace."""
+    return os.path.join(workspace, os.path.relpath(path, BUILD_SCRIPTS_DIR))
+
+
+def image_ref(image_name):
+    """Normalize an image name to repository:tag form (":latest" when untagged)."""
+    if "@" in image_name or ":" in image_name.rsplit("/", 1)[-1]:
+        return image_name
+    return f"{image_name}:latest"
+
+
+def missing_images(image_names):
+    """
+    Names in image_names that do not exist locally, from one
+    `docker image inspect` call. Raises RuntimeError when the check itself
+    fails, so that no image is created by mistake.
+    """
+    names = sorted(set(image_names))
+    if not names:
+        return set()
+    r = run(["docker", "image", "inspect", "--format", "{{.Id}}"] + names)
+    if r.returncode == 0:
+        return set()
+
+    missing = set()
+    for line in r.stderr.strip().splitlines():
+        ref = line.partition("No such image:")[2].strip()
+        matched = {n for n in names if ref and ref in (n, image_ref(n))}
+        if not matched:
+            raise RuntimeError(f"docker image inspect failed: {line.strip()}")
+        missing |= matched
+    if not missing:
+        raise RuntimeError(f"docker image inspect failed (exit {r.returncode})")
+    return missing
+
+
+def create_image(image_name):
+    """Create image_name as a plain UBI base image; returns True on success."""
+    # Unique name: several images may be created at the same time
+    container = f"tmp-build-image-{uuid.uuid4().hex[:12]}"
+    r = run(
+        [
+            "docker", "run", "--name", container,
+            "registry.access.redhat.com/ubi9/ubi", "true"
+        ]
+    )
+
+    if r.returncode != 0:
+        print(f"[FAIL] Unable to start base container for {image_name}:", r.stderr.strip())
+        run(["docker", "rm", "-f", container])
+        return False
+
+    r = run(["docker", "commit", container, image_name])
+    run(["docker", "rm", container])
+    if r.returncode != 0:
+        print(f"[FAIL] Unable to commit base image {image_name}:", r.stderr.strip())
+        return False
+
+    print(f"[INFO] Docker image created: {image_name}")
+    return True
+
+
+def prebuild_images(image_names, pool):
+    """
+    Make sure every image of the batch exists before any build starts.
+
+    Presence is checked for all images with a single `docker image inspect`
+    call and missing ones are created concurrently on pool. Returns the set of
+    image names that are available; raises RuntimeError if the check fails.
+    """
+    missing = sorted(missing_images(image_names))
+    available = set(image_names) - set(missing)
+    print(f"[INFO] Docker images: {len(available)} present, {len(missing)} to create")
+
+    futures = {pool.submit(create_image, name): name for name in missing}
+    for future, name in futures.items():
+        try:
+            if future.result():
+                available.add(name)
+        except Exception as e:
+            print(f"[FAIL] Unable to create image {name}: {e}")
+    return available
+
+
+def build_log_path(pkg_name, version, py_version):
+    os.makedirs(BUILD_LOG_DIR, exist_ok=True)
+    return os.path.join(BUILD_LOG_DIR, f"{pkg_name}-{version}-py{py_version}.log.gz")
+
+
+def workspace_wheels(workspace):
+    """All .whl files currently inside a workspace."""
+    found = set()
+    for root, dirs, files in os.walk(workspace):
+        dirs[:] = [d for d in dirs if d != ".git"]
+        found.update(os.path.join(root, f) for f in files if f.endswith(".whl"))
+    return found
+
+
+def collect_built_wheels(workspace, before, pkg_name, version):
+    """Move wheels that appeared in workspace since before out to BUILT_WHEELS_DIR."""
+    new = sorted(workspace_wheels(workspace) - before)
+    if not new:
+        return []
+    dest_dir = os.path.join(BUILT_WHEELS_DIR, pkg_name, version)
+    os.makedirs(dest_dir, exist_ok=True)
+    moved = []
+    for path in new:
+        dest = os.path.join(dest_dir, os.path.basename(path))
+        shutil.move(path, dest)
+        moved.append(dest)
+    return moved
+
+
+def outcome(status, message="", **details):
+    """Result of one FAILED wheel's source build, as stored in the state store."""
+    return dict(details, status=status, message=message)
+
+
+def make_say(prefix):
+    """Print helper tagging each line with prefix, safe across worker threads."""
+    def say(msg):
+        with PRINT_LOCK:
+            print(f"[{prefix}] {msg}", flush=True)
+    return say
+
+
+def resolve_build(pkg_name, version, workspace, read_buildinfo, resolver, say):
+    """Return (build_script, image_name) for a package version, or None to skip it."""
+    # --------------------------------------------------
+    # 5. Resolve BUILD_SCRIPT and IMAGE_NAME
+    # --------------------------------------------------
+    say("[STEP] Resolving build metadata (read_buildinfo.sh)")
+    build_script, image_name = resolver.lookup(pkg_name, version, workspace, read_buildinfo)
+
+    # --------------------------------------------------
+    # 6. Fallback version if BUILD_SCRIPT empty
+    # --------------------------------------------------
+    if not build_script:
+        say("[INFO] BUILD_SCRIPT empty, trying fallback version")
+        try:
+            major, minor, *_ = version.split(".")
+            fallback_version = f"{major}.{minor}.0"
+        except Exception:
+            say("[SKIP] Invalid version format")
+            return None
+
+        say(f"[INFO] Retrying with VERSION = {fallback_version}")
+        build_script, image_name = resolver.lookup(pkg_name, fallback_version, workspace, read_buildinfo)
+
+        if not build_script:
+            say("[SKIP] No BUILD_SCRIPT even after fallback")
+            return None
+
+    say(f"[INFO] BUILD_SCRIPT : {build_script}")
+    say(f"[INFO] IMAGE_NAME  : {image_name}")
+    return build_script, image_name
+
+
+def build_python_version(key, py_version, wheel_names, say, workspace, create_wheel):
+    """
+    Build one python version of a (package, version, build_script, image)
+    group in workspace. wheel_names are the FAILED wheels it rebuilds;
+    returns {wheel_name: outcome}.
+    """
+    pkg_name, version, build_script, image_name = key
+    details = {
+        "build_script": build_script,
+        "image_name": image_name,
+        "python_version": py_version,
+    }
+    if CANCEL.is_set():
+        return dict.fromkeys(wheel_names, outcome("CANCELLED", "not started", **details))
+
+    # --------------------------------------------------
+    # 7. Build wheel inside container
+    # --------------------------------------------------
+    wrapper_name = os.path.basename(create_wheel)
+    build_wheels_script = in_workspace(BUILD_WHEELS_SCRIPT, workspace)
+    log_path = build_log_path(pkg_name, version, py_version)
+    say(f"[STEP] Building {pkg_name} {version} in container (python {py_version}, workspace {workspace}), log: {log_path}")
+
+    build_id = uuid.uuid4().hex
+    env = container_env(
+        os.environ,
+        DOCKER_SHIM_DIR,
+        REAL_DOCKER,
+        build_id,
+        BUILD_CONTAINER_CPUS,
+        BUILD_CONTAINER_MEMORY_GB * 1024,
+    )
+    # Also covers containers started through the docker API, bypassing the wrapper
+    containers = (
+        BuildContainers(build_id, workspace, BUILD_CONTAINER_CPUS, BUILD_CONTAINER_MEMORY_GB * 1024)
+        if REAL_DOCKER
+        else None
+    )
+
+    before = workspace_wheels(workspace)
+    start = time.monotonic()
+    r = run_streaming(
+        [
+            "python",
+            build_wheels_script,
+            wrapper_name,
+            py_version,
+            image_name,
+            build_script,
+            version,
+        ],
+        log_path,
+        say,
+        cwd=os.path.dirname(build_wheels_script),
+        env=env,
+        tail_lines=BUILD_LOG_TAIL_LINES,
+        progress_seconds=BUILD_PROGRESS_SECONDS,
+        timeout=BUILD_TIMEOUT_SECONDS,
+        idle_timeout=BUILD_IDLE_TIMEOUT_SECONDS,
+        cancel=CANCEL,
+        on_cancel=containers.kill if containers else None,
+        on_poll=containers.poll if containers else None,
+    )
+    if containers is not None and not containers.poll(force=True):
+        say(f"[WARN] No container of this build was found (python {py_version}): CPU/memory limits and cleanup were not applied")
+    details["duration_seconds"] = round(time.monotonic() - start, 1)
+    details["log_path"] = log_path
+    details["produced_wheels"] = collect_built_wheels(workspace, before, pkg_name, version)
+    message = ""
+
+    if r.stderr:
+        # Stopped by a timeout or cancellation
+        say(f"[FAIL] Source build stopped: {r.stderr} (python {py_version}), log: {log_path}")
+        status = "CANCELLED" if CANCEL.is_set() else "TIMEOUT"
+        message = r.stderr
+    elif r.returncode != 0:
+        # Only the tail; the full output is in the compressed log
+        with PRINT_LOCK:
+            print(f"----- BUILD LOG TAIL: {pkg_name} {version} python {py_version} -----")
+            print(r.stdout, flush=True)
+        say(f"[FAIL] Source build failed (python {py_version}), full log: {log_path}")
+        status = "FAIL"
+        message = r.stdout.strip().splitlines()[-1] if r.stdout.strip() else ""
+    else:
+        say(f"[SUCCESS] Source build completed (python {py_version}): {details['produced_wheels']}")
+        status = "SUCCESS"
+    return dict.fromkeys(wheel_names, outcome(status, message, **details))
+
+
+def print_summary(results):
+    counts = defaultdict(int)
+    for result in results.values():
+        counts[result["status"]] += 1
+
+    print(f"\n===== PHASE 2 {'CANCELLED' if CANCEL.is_set() else 'COMPLETED'} =====")
+    for status in ("SUCCESS", "FAIL", "TIMEOUT", "CANCELLED", "ERROR", "SKIP"):
+        print(f"{status}: {counts[status]}")
+
+
+def py_version_key(py_version):
+    return tuple(int(p) for p in py_version.split("."))
+
+
 def main():
     # --------------------------------------------------
-    # 1. Load FAILED wheels from CSV
+    # 1. Load FAILED wheels from the state store
     # --------------------------------------------------
-    if not os.path.exists(CSV_PATH):
-        print("[ERROR] CSV not found:", CSV_PATH)
+    if not os.path.exists(STATE_DB_PATH) and not os.path.exists(CSV_PATH):
+        print("[ERROR] State store not found:", STATE_DB_PATH)
         return
 
-    failed_wheels = []
-
-    with open(CSV_PATH, newline="") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row.get("auditwheel_status") == "FAILED":
-                failed_wheels.append(row["wheel_path"])
+    store = StateStore(OUTPUT_DIR)
+    try:
+        failed_wheels = store.failed()
+    finally:
+        store.close()
 
     print("\n===== PHASE 2 : SOURCE BUILD PIPELINE =====")
     print(f"Total FAILED wheels found: {len(failed_wheels)}")
@@ -66,26 +457,30 @@ def main():
         return
 
     # --------------------------------------------------
-    # 2. clone build-scripts repo 
+    # 2. clone or update build-scripts repo
     # --------------------------------------------------
     print("\n[SETUP] Ensuring build-scripts repository")
 
-    if not os.path.exists(BUILD_SCRIPTS_DIR):
-        print("[SETUP] Cloning build-scripts repo...")
-        r = run(["git", "clone", BUILD_SCRIPTS_REPO, BUILD_SCRIPTS_DIR])
-        if r.returncode != 0:
-            print("[ERROR] Failed to clone build-scripts repo")
-            print(r.stderr)
-            return
-        print("[SETUP] build-scripts cloned successfully")
-    else:
-        print("[SETUP] Using existing repo:", BUILD_SCRIPTS_DIR)
+    checkout = BuildScriptsCheckout(
+        BUILD_SCRIPTS_DIR,
+        BUILD_SCRIPTS_MIRROR or BUILD_SCRIPTS_REPO,
+        ref=BUILD_SCRIPTS_REF,
+        pin=BUILD_SCRIPTS_COMMIT,
+        update=BUILD_SCRIPTS_UPDATE,
+        index_cache=BUILD_SCRIPTS_INDEX,
+    )
+    try:
+        commit = checkout.ensure()
+    except RuntimeError as e:
+        print("[ERROR] build-scripts repo unavailable:", e)
+        return
+    print(f"[SETUP] build-scripts at {commit}: {BUILD_SCRIPTS_DIR}")
 
     # --------------------------------------------------
     # 3. Locate required scripts
     # --------------------------------------------------
-    read_buildinfo = find_script(BUILD_SCRIPTS_DIR, "read_buildinfo.sh")
-    create_wheel = find_script(BUILD_SCRIPTS_DIR, "create_wheel_wrapper.sh")
+    read_buildinfo = checkout.find("read_buildinfo.sh")
+    create_wheel = checkout.find("create_wheel_wrapper.sh")
 
     if not read_buildinfo or not create_wheel:
         print("[ERROR] Required scripts not found")
@@ -93,152 +488,230 @@ def main():
         print("create_wheel_wrapper.sh:", create_wheel)
         return
 
+    global REAL_DOCKER
+    REAL_DOCKER = install_docker_shim(DOCKER_SHIM_DIR)
+    print(
+        f"[INFO] Per-build limits: {BUILD_CONTAINER_CPUS:g} CPUs, {BUILD_CONTAINER_MEMORY_GB:g} GB,"
+        f" {BUILD_TIMEOUT_SECONDS}s total, {BUILD_IDLE_TIMEOUT_SECONDS}s without output"
+    )
+    if REAL_DOCKER is None:
+        print("[WARN] docker not found on PATH, container limits are not applied")
+
+    workspaces = WorkspacePool(BUILD_SCRIPTS_DIR, BUILD_WORKSPACES_DIR, BUILD_WORKERS)
+    resolver = BuildInfoResolver(workspaces.commit)
+    store = StateStore(OUTPUT_DIR)
+
     # --------------------------------------------------
-    # 4. Process wheels ONE BY ONE
+    # 4. Skip wheels whose recorded outcome still holds
     # --------------------------------------------------
-    total = len(failed_wheels)
-
-    for idx, wheel_name in enumerate(failed_wheels, start=1):
-        print("\n" + "=" * 80)
-        print(f"[{idx}/{total}] Processing wheel: {wheel_name}")
-        print("=" * 80)
+    if not SOURCE_BUILD_FORCE:
+        previous = store.source_builds()
+        done = {
+            name
+            for name, row in previous.items()
+            if row["status"] == "SUCCESS"
+            or (
+                row["status"] in DETERMINISTIC_STATUSES
+                and workspaces.commit
+                and row["build_commit"] == workspaces.commit
+            )
+        }
+        if done:
+            print(f"[INFO] Skipping {len(done)} wheels already built or failing at this build-scripts commit")
+            failed_wheels = [w for w in failed_wheels if w not in done]
 
+    # --------------------------------------------------
+    # 4a. Group FAILED wheels by package version
+    # --------------------------------------------------
+    results = {}
+
+    # Built wheels go straight to the auditwheel repair / pip test / upload
+    # stages, on their own workers so builds don't wait for them.
+    repair = load_repair_module() if SOURCE_BUILD_REPAIR else None
+    repair_pool = ThreadPoolExecutor(max_workers=PIP_WORKERS) if repair else None
+    repairs = {}
+
+    def record(wheel_name, result):
+        results[wheel_name] = result
+        store.upsert_build(wheel_name, build_commit=workspaces.commit, **result)
+        if repair_pool is None or result["status"] != "SUCCESS":
+            return
+        for path in result.get("produced_wheels", []):
+            if path not in repairs:
+                print(f"[STEP] Handing {os.path.basename(path)} to auditwheel repair")
+                repairs[path] = repair_pool.submit(repair.process_local_wheel, path)
+
+    def unrepaired(row):
+        """Built wheels of a SUCCESS build with no wheels row written after the build."""
+        pending = []
+        for path in row["produced_wheels"]:
+            if not os.path.exists(path):
+                continue
+            repaired = store.wheel(os.path.basename(path))
+            if repaired is None or (repaired["updated_at"] or 0) < row["updated_at"]:
+                pending.append(path)
+        return pending
+
+    if repair_pool is not None and not SOURCE_BUILD_FORCE:
+        # Repair failed or was interrupted in an earlier run: the build is
+        # skipped as done, so hand its wheels to repair again
+        for row in store.source_builds("SUCCESS").values():
+            for path in unrepaired(row):
+                if path not in repairs:
+                    print(f"[STEP] Handing {os.path.basename(path)} to auditwheel repair (pending from an earlier run)")
+                    repairs[path] = repair_pool.submit(repair.process_local_wheel, path)
+
+    versions = defaultdict(lambda: defaultdict(list))
+    for wheel_name in failed_wheels:
         parts = wheel_name.split("-")
         pkg_name = parts[0]
         version = parts[1]
         py_version = python_version_from_wheel(wheel_name)
-
-        print(f"[INFO] Package       : {pkg_name}")
-        print(f"[INFO] Version       : {version}")
-        print(f"[INFO] Python version: {py_version}")
-
         if not py_version:
-            print("[SKIP] Could not determine python version")
+            print(f"[SKIP] Could not determine python version: {wheel_name}")
+            record(wheel_name, outcome("SKIP", "could not determine python version"))
             continue
+        versions[(pkg_name, version)][py_version].append(wheel_name)
 
-        # --------------------------------------------------
-        # 5. Resolve BUILD_SCRIPT and IMAGE_NAME
-        # --------------------------------------------------
-        env = os.environ.copy()
-        env["PACKAGE_NAME"] = pkg_name
-        env["VERSION"] = version
-
-        print("[STEP] Resolving build metadata (read_buildinfo.sh)")
-        r = run(["bash", read_buildinfo], cwd=BUILD_SCRIPTS_DIR, env=env)
-
-        build_script = run(
-        ["bash", "-c", "source variable.sh && echo $BUILD_SCRIPT"],
-        cwd=BUILD_SCRIPTS_DIR,
-        ).stdout.strip()
-
-
-        image_name = run(
-        ["bash", "-c", "source variable.sh && echo $IMAGE_NAME"],
-        cwd=BUILD_SCRIPTS_DIR,
-        ).stdout.strip()
-
-        if build_script and "/" not in build_script:
-            build_script = f"scripts/{build_script}"
-
-
-        # --------------------------------------------------
-        # 6. Fallback version if BUILD_SCRIPT empty
-        # --------------------------------------------------
-        if not build_script:
-            print("[INFO] BUILD_SCRIPT empty, trying fallback version")
-            try:
-                major, minor, *_ = version.split(".")
-                fallback_version = f"{major}.{minor}.0"
-            except Exception:
-                print("[SKIP] Invalid version format")
-                continue
-
-            env["VERSION"] = fallback_version
-            print("[INFO] Retrying with VERSION =", fallback_version)
-
-            run(["bash", read_buildinfo], cwd=BUILD_SCRIPTS_DIR, env=env)
-
-            build_script = run(
-            ["bash", "-c", "source variable.sh && echo $BUILD_SCRIPT"],
-            cwd=BUILD_SCRIPTS_DIR,
-            ).stdout.strip()
-
-
-            image_name = run(
-            ["bash", "-c", "source variable.sh && echo $IMAGE_NAME"],
-            cwd=BUILD_SCRIPTS_DIR,
-            ).stdout.strip()
-
-            if not build_script:
-                print("[SKIP] No BUILD_SCRIPT even after fallback")
-                continue
-
-        print("[INFO] BUILD_SCRIPT :", build_script)
-        print("[INFO] IMAGE_NAME  :", image_name)
+    print(f"[INFO] {len(failed_wheels)} FAILED wheels across {len(versions)} package versions")
+    print(f"[INFO] Building with {BUILD_WORKERS} concurrent workers")
 
-        # --------------------------------------------------
-        # 6.5 create docker image if not exists
-        # --------------------------------------------------
-        print("[STEP] Ensuring docker image exists")
-
-        img_check = run(
-            ["docker", "image", "inspect", image_name],
-        )
-
-        if img_check.returncode != 0:
-            print(f"[INFO] Image not found locally, creating base image: {image_name}")
+    def resolve(pkg_name, version):
+        with workspaces.checkout() as workspace:
+            return resolve_build(
+                pkg_name,
+                version,
+                workspace,
+                in_workspace(read_buildinfo, workspace),
+                resolver,
+                make_say(f"{pkg_name} {version}"),
+            )
 
-            r = run(
-                [
-                    "docker", "run", "--name", "tmp-build-image",
-                    "registry.access.redhat.com/ubi9/ubi", "true"
-                ]
+    def build(idx, total, key, py_version, wheel_names):
+        with workspaces.checkout() as workspace:
+            return build_python_version(
+                key,
+                py_version,
+                wheel_names,
+                make_say(f"{idx}/{total}"),
+                workspace,
+                in_workspace(create_wheel, workspace),
             )
 
-            if r.returncode != 0:
-                print("[FAIL] Unable to start base container")
+    def drain(resolves, builds):
+        """After CANCEL: drop queued jobs and record what the running builds report."""
+        for future in list(resolves) + list(builds):
+            future.cancel()
+        for future, wheel_names in builds.items():
+            if future.cancelled():
+                for w in wheel_names:
+                    record(w, outcome("CANCELLED", "not started"))
                 continue
-
-            run(["docker", "commit", "tmp-build-image", image_name])
-            run(["docker", "rm", "tmp-build-image"])
-
-            print(f"[INFO] Docker image created: {image_name}")
-        else:
-            print("[INFO] Docker image already exists")
+            try:
+                for wheel_name, result in future.result().items():
+                    record(wheel_name, result)
+            except Exception as e:
+                for w in wheel_names:
+                    record(w, outcome("ERROR", str(e)))
+
+    resolves = {}
+    builds = {}
+    try:
+        with ThreadPoolExecutor(max_workers=BUILD_WORKERS) as pool:
+            try:
+                # --------------------------------------------------
+                # 4b. Resolve build metadata once per package version
+                # --------------------------------------------------
+                groups = defaultdict(dict)
+                resolves = {pool.submit(resolve, *pv): pv for pv in versions}
+                for future, (pkg_name, version) in resolves.items():
+                    py_versions = versions[(pkg_name, version)]
+                    try:
+                        info = future.result()
+                    except Exception as e:
+                        print(f"[FAIL] {pkg_name} {version}: {e}")
+                        for wheels in py_versions.values():
+                            for w in wheels:
+                                record(w, outcome("ERROR", f"metadata resolution failed: {e}"))
+                        continue
+                    if info is None:
+                        for wheels in py_versions.values():
+                            for w in wheels:
+                                record(w, outcome("SKIP", "no BUILD_SCRIPT for this version"))
+                        continue
+                    group = groups[(pkg_name, version) + info]
+                    for py_version, wheels in py_versions.items():
+                        group.setdefault(py_version, []).extend(wheels)
+
+                # --------------------------------------------------
+                # 4c. Create missing docker images up front
+                # --------------------------------------------------
+                print("\n[SETUP] Ensuring docker images exist")
+                try:
+                    images = prebuild_images({key[3] for key in groups}, pool)
+                except RuntimeError as e:
+                    # Never create (and overwrite) images we could not check
+                    print(f"[ERROR] {e}")
+                    images = set()
+                for key in [k for k in groups if k[3] not in images]:
+                    print(f"[FAIL] {key[0]} {key[1]}: docker image {key[3]} unavailable")
+                    for wheels in groups.pop(key).values():
+                        for w in wheels:
+                            record(w, outcome(
+                                "ERROR", "docker image unavailable",
+                                build_script=key[2], image_name=key[3],
+                            ))
+
+                # --------------------------------------------------
+                # 4d. Build each python version of a group as its own job
+                # --------------------------------------------------
+                jobs = [
+                    (key, py_version, group[py_version])
+                    for key, group in groups.items()
+                    for py_version in sorted(group, key=py_version_key)
+                ]
+                total = len(jobs)
+                for idx, (key, py_version, wheel_names) in enumerate(jobs, start=1):
+                    builds[pool.submit(build, idx, total, key, py_version, wheel_names)] = wheel_names
+                # Record (and hand to repair) each build as soon as it finishes
+                for future in as_completed(builds):
+                    wheel_names = builds[future]
+                    try:
+                        for wheel_name, result in future.result().items():
+                            record(wheel_name, result)
+                    except Exception as e:
+                        print(f"[FAIL] {e}")
+                        for w in wheel_names:
+                            record(w, outcome("ERROR", str(e)))
+                    # Builds take minutes: persist each outcome right away
+                    store.flush()
+            except BaseException:
+                # Ctrl-C or a fatal error: stop running builds, drop queued ones
+                CANCEL.set()
+                drain(resolves, builds)
+                raise
 
         # --------------------------------------------------
-        # 7. Build wheel inside container
+        # 4e. Wait for repair, pip test and upload of built wheels
         # --------------------------------------------------
-        print("[STEP] Building wheel in container")
-
-        wrapper_name = os.path.basename(create_wheel)
-
-        r = run(
-            [
-                "python",
-                BUILD_WHEELS_SCRIPT,
-                wrapper_name,
-                py_version,
-                image_name,
-                build_script,
-                version,
-            ],
-            cwd=os.path.dirname(BUILD_WHEELS_SCRIPT),
-        )
-
-
-        print("----- BUILD STDOUT -----")
-        print(r.stdout)
-        print("----- BUILD STDERR -----")
-        print(r.stderr)
-
-        if r.returncode != 0:
-            print("[FAIL] Source build failed")
-            continue
-
-        print("[SUCCESS] Source build completed")
-
-    print("\n===== PHASE 2 COMPLETED =====")
+        for path, future in repairs.items():
+            try:
+                name, audit_status, audit_msg, pip_status, pip_msg, bundled, timings = future.result()
+            except Exception as e:
+                print(f"[FAIL] Repair of {path} failed, retried on the next run: {e}")
+                continue
+            store.upsert(name, audit_status, audit_msg, pip_status, pip_msg, bundled, timings)
+            print(f"[INFO] {name}: auditwheel {audit_status}, pip {pip_status}")
+    finally:
+        if repair_pool is not None:
+            for future in repairs.values():
+                future.cancel()
+            repair_pool.shutdown(wait=True)
+            repair.VENV_POOL.close()
+        resolver.save()
+        store.export_csv()
+        store.close()
+        print_summary(results)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,399 @@
+"""
+SQLite-backed wheel state store shared by auditwheel-repair.py and
+source_build_pipeline.py.
+
+One row per wheel holds the auditwheel/pip results and per-stage timings,
+bundled libraries live in their own table and source rebuilds of FAILED
+wheels (source_build_pipeline.py) record their outcome in source_builds. Status, package, version and
+python tag are indexed so both pipelines can ask e.g. "FAILED for numpy
+cp311" without scanning a CSV. Rows are upserted and commits (and therefore
+fsyncs) are batched; the database runs in WAL mode so a crash loses at most
+the last uncommitted batch.
+
+The CSV reports in OUTPUT_DIR are produced by export, at the end of a run or
+on demand with:
+
+    python state_store.py
+"""
+
+import os
+import csv
+import json
+import time
+import sqlite3
+import threading
+from config import OUTPUT_DIR, STATE_DB_NAME, STATE_SYNC_EVERY, STATE_SYNC_SECONDS
+
+STATUS_FIELDS = [
+    "wheel_path",
+    "auditwheel_status",
+    "auditwheel_message",
+    "pip_install_status",
+    "pip_install_message",
+]
+
+TIMING_FIELDS = [
+    "download_seconds",
+    "repair_seconds",
+    "license_seconds",
+    "pip_seconds",
+    "upload_seconds",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS wheels (
+    wheel_path TEXT PRIMARY KEY,
+    package TEXT,
+    version TEXT,
+    python_tag TEXT,
+    auditwheel_status TEXT,
+    auditwheel_message TEXT,
+    pip_install_status TEXT,
+    pip_install_message TEXT,
+    download_seconds REAL,
+    repair_seconds REAL,
+    license_seconds REAL,
+    pip_seconds REAL,
+    upload_seconds REAL,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_wheels_audit_status ON wheels (auditwheel_status);
+CREATE INDEX IF NOT EXISTS idx_wheels_pip_status ON wheels (pip_install_status);
+CREATE INDEX IF NOT EXISTS idx_wheels_package_version ON wheels (package, version);
+CREATE INDEX IF NOT EXISTS idx_wheels_python_tag ON wheels (python_tag);
+
+CREATE TABLE IF NOT EXISTS bundled_libs (
+    wheel_path TEXT NOT NULL,
+    native_library TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_bundled_libs_wheel ON bundled_libs (wheel_path);
+
+CREATE TABLE IF NOT EXISTS source_builds (
+    wheel_path TEXT PRIMARY KEY,
+    status TEXT,
+    build_commit TEXT,
+    build_script TEXT,
+    image_name TEXT,
+    python_version TEXT,
+    duration_seconds REAL,
+    log_path TEXT,
+    produced_wheels TEXT,
+    message TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_source_builds_status ON source_builds (status);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+UPSERT_WHEEL = (
+    "INSERT INTO wheels (wheel_path, package, version, python_tag,"
+    " auditwheel_status, auditwheel_message, pip_install_status, pip_install_message,"
+    " download_seconds, repair_seconds, license_seconds, pip_seconds, upload_seconds,"
+    " updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    " ON CONFLICT (wheel_path) DO UPDATE SET"
+    " auditwheel_status = excluded.auditwheel_status,"
+    " auditwheel_message = excluded.auditwheel_message,"
+    " pip_install_status = excluded.pip_install_status,"
+    " pip_install_message = excluded.pip_install_message,"
+    " download_seconds = excluded.download_seconds,"
+    " repair_seconds = excluded.repair_seconds,"
+    " license_seconds = excluded.license_seconds,"
+    " pip_seconds = excluded.pip_seconds,"
+    " upload_seconds = excluded.upload_seconds,"
+    " updated_at = excluded.updated_at"
+)
+
+SOURCE_BUILD_FIELDS = [
+    "wheel_path",
+    "status",
+    "build_commit",
+    "build_script",
+    "image_name",
+    "python_version",
+    "duration_seconds",
+    "log_path",
+    "produced_wheels",
+    "message",
+]
+
+UPSERT_SOURCE_BUILD = (
+    "INSERT OR REPLACE INTO source_builds ("
+    + ", ".join(SOURCE_BUILD_FIELDS)
+    + ", updated_at) VALUES ("
+    + ", ".join("?" * (len(SOURCE_BUILD_FIELDS) + 1))
+    + ")"
+)
+
+
+def parse_wheel_name(name):
+    """Return (package, version, python_tag) for a wheel filename."""
+    parts = name.split("-")
+    py_tag = None
+    for p in parts:
+        if p.startswith("cp") and p[2:].isdigit():
+            py_tag = p
+            break
+    return parts[0], parts[1] if len(parts) > 1 else "", py_tag
+
+
+class StateStore:
+    """Thread-safe per-wheel state with batched upserts."""
+
+    def __init__(self, output_dir=OUTPUT_DIR):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(output_dir, STATE_DB_NAME)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=FULL")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+        if self._is_empty():
+            self._import_csv()
+
+    def _is_empty(self):
+        return self.db.execute("SELECT 1 FROM wheels LIMIT 1").fetchone() is None
+
+    def _write(self, name, audit_status, audit_msg, pip_status, pip_msg, libs, timings):
+        pkg, ver, py_tag = parse_wheel_name(name)
+        self.db.execute(
+            UPSERT_WHEEL,
+            [name, pkg, ver, py_tag, audit_status, audit_msg, pip_status, pip_msg]
+            + [timings.get(k) for k in TIMING_FIELDS]
+            + [time.time()],
+        )
+        self.db.execute("DELETE FROM bundled_libs WHERE wheel_path = ?", (name,))
+        self.db.executemany(
+            "INSERT INTO bundled_libs (wheel_path, native_library) VALUES (?, ?)",
+            [(name, lib) for lib in libs],
+        )
+
+    def _import_csv(self):
+        """Seed the store from CSV reports written by older runs."""
+        status_csv = os.path.join(self.output_dir, "wheel_status.csv")
+        all_csv = os.path.join(self.output_dir, "native_libs_all.csv")
+        if not os.path.exists(status_csv):
+            return
+
+        libs = {}
+        if os.path.exists(all_csv):
+            with open(all_csv, newline="") as f:
+                for row in csv.DictReader(f):
+                    if row["native_library"] != "not found":
+                        libs.setdefault(row["wheel_path"], []).append(row["native_library"])
+
+        with open(status_csv, newline="") as f:
+            rows = list(csv.DictReader(f))
+
+        with self._lock:
+            for row in rows:
+                self._write(
+                    *[row[k] for k in STATUS_FIELDS],
+                    libs.get(row["wheel_path"], []),
+                    {},
+                )
+            self.db.commit()
+        print(f"[INFO] Imported {len(rows)} rows from {status_csv} into {self.path}")
+
+    def upsert(self, name, audit_status, audit_msg, pip_status, pip_msg, bundled, timings=None):
+        """Insert or replace the result of one finished wheel."""
+        with self._lock:
+            self._write(
+                name, audit_status, audit_msg, pip_status, pip_msg,
+                bundled or [], timings or {},
+            )
+            self._pending += 1
+            if (
+                self._pending >= STATE_SYNC_EVERY
+                or time.monotonic() - self._last_sync >= STATE_SYNC_SECONDS
+            ):
+                self._sync()
+
+    def upsert_build(self, name, status, build_commit=None, build_script=None, image_name=None,
+                     python_version=None, duration_seconds=None, log_path=None,
+                     produced_wheels=None, message=""):
+        """Record the latest source build outcome of a FAILED wheel."""
+        with self._lock:
+            self.db.execute(
+                UPSERT_SOURCE_BUILD,
+                (
+                    name, status, build_commit, build_script, image_name,
+                    python_version, duration_seconds, log_path,
+                    json.dumps(produced_wheels or []), message, time.time(),
+                ),
+            )
+            self._pending += 1
+            if (
+                self._pending >= STATE_SYNC_EVERY
+                or time.monotonic() - self._last_sync >= STATE_SYNC_SECONDS
+            ):
+                self._sync()
+
+    def source_builds(self, status=None):
+        """Latest source build outcome per wheel (as dicts), optionally by status."""
+        sql = "SELECT * FROM source_builds"
+        args = ()
+        if status is not None:
+            sql += " WHERE status = ?"
+            args = (status,)
+        with self._lock:
+            rows = [dict(r) for r in self.db.execute(sql + " ORDER BY wheel_path", args)]
+        for row in rows:
+            row["produced_wheels"] = json.loads(row["produced_wheels"] or "[]")
+        return {row["wheel_path"]: row for row in rows}
+
+    def _sync(self):
+        self.db.commit()
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def flush(self):
+        """Commit any pending upserts."""
+        with self._lock:
+            self._sync()
+
+    def query(self, auditwheel_status=None, pip_install_status=None,
+              package=None, version=None, python_tag=None):
+        """Return wheel rows (as dicts) matching every given filter."""
+        filters = {
+            "auditwheel_status": auditwheel_status,
+            "pip_install_status": pip_install_status,
+            "package": package,
+            "version": version,
+            "python_tag": python_tag,
+        }
+        where = [f"{k} = ?" for k, v in filters.items() if v is not None]
+        sql = "SELECT * FROM wheels"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY wheel_path"
+        with self._lock:
+            rows = self.db.execute(sql, [v for v in filters.values() if v is not None])
+            return [dict(r) for r in rows]
+
+    def failed(self, package=None, version=None, python_tag=None):
+        """Names of wheels whose auditwheel repair FAILED."""
+        return [
+            r["wheel_path"]
+            for r in self.query(
+                auditwheel_status="FAILED",
+                package=package,
+                version=version,
+                python_tag=python_tag,
+            )
+        ]
+
+    def wheel(self, name):
+        """The wheels row of name (as a dict), or None."""
+        with self._lock:
+            row = self.db.execute("SELECT * FROM wheels WHERE wheel_path = ?", (name,)).fetchone()
+        return dict(row) if row else None
+
+    def bundled_libs(self, name):
+        """Native libraries recorded for a wheel."""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT native_library FROM bundled_libs WHERE wheel_path = ? ORDER BY rowid",
+                (name,),
+            )
+            return [r[0] for r in rows]
+
+    def get_meta(self, key, default=None):
+        """Return a stored run-level value (e.g. a sync high-water mark)."""
+        with self._lock:
+            row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        """Store a run-level value and commit immediately."""
+        with self._lock:
+            self.db.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+            self._sync()
+
+    def load(self):
+        """
+        Load resume state.
+
+        Returns (status, libs): status maps wheel_path to its status row,
+        libs maps wheel_path to its list of native libraries ("not found"
+        when none were bundled).
+        """
+        status = {}
+        libs = {}
+        with self._lock:
+            for row in self.db.execute("SELECT * FROM wheels ORDER BY rowid"):
+                status[row["wheel_path"]] = {k: row[k] for k in STATUS_FIELDS}
+                libs[row["wheel_path"]] = []
+            for row in self.db.execute(
+                "SELECT wheel_path, native_library FROM bundled_libs ORDER BY rowid"
+            ):
+                libs.setdefault(row[0], []).append(row[1])
+        for name, wheel_libs in libs.items():
+            if not wheel_libs:
+                wheel_libs.append("not found")
+        return status, libs
+
+    def export_csv(self):
+        """Write wheel_status.csv, native_libs_all.csv, native_libs_external.csv and source_builds.csv."""
+        self.flush()
+        status, libs = self.load()
+
+        status_csv = os.path.join(self.output_dir, "wheel_status.csv")
+        with open(status_csv + ".tmp", "w", newline="") as fw:
+            w = csv.writer(fw)
+            w.writerow(STATUS_FIELDS)
+            for row in status.values():
+                w.writerow([row[k] for k in STATUS_FIELDS])
+        os.replace(status_csv + ".tmp", status_csv)
+
+        # All and bundled libs CSVs carry the same rows
+        for name in ("native_libs_all.csv", "native_libs_external.csv"):
+            path = os.path.join(self.output_dir, name)
+            with open(path + ".tmp", "w", newline="") as fw:
+                w = csv.writer(fw)
+                w.writerow(["wheel_path", "native_library"])
+                for wheel, wheel_libs in libs.items():
+                    for lib in wheel_libs:
+                        w.writerow([wheel, lib])
+            os.replace(path + ".tmp", path)
+
+        builds = self.source_builds()
+        if builds:
+            path = os.path.join(self.output_dir, "source_builds.csv")
+            with open(path + ".tmp", "w", newline="") as fw:
+                w = csv.writer(fw)
+                w.writerow(SOURCE_BUILD_FIELDS)
+                for row in builds.values():
+                    row["produced_wheels"] = ";".join(row["produced_wheels"])
+                    w.writerow([row[k] for k in SOURCE_BUILD_FIELDS])
+            os.replace(path + ".tmp", path)
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+def main():
+    store = StateStore()
+    try:
+        store.export_csv()
+    finally:
+        store.close()
+    print(f"[INFO] CSV reports written to {OUTPUT_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Pool of pre-warmed virtual environments used for pip install verification.
+
+For every interpreter a template venv is created once and pip, setuptools and
+wheel are upgraded in it. Pool venvs are created with `--without-pip` and get a
+copy of the template site-packages, so the (possibly networked) pip upgrade
+runs once per interpreter instead of once per wheel. After each use the venv
+is reset back to the template snapshot and returned to the pool.
+"""
+
+import os
+import glob
+import queue
+import shutil
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager
+
+
+def create_venv(py, with_pip=True):
+    """Create a virtual environment using the specified python binary."""
+    d = tempfile.mkdtemp(prefix="wheel-venv-")
+    cmd = [py, "-m", "venv", d]
+    if not with_pip:
+        cmd.append("--without-pip")
+    subprocess.check_call(cmd)
+    return d
+
+
+def upgrade_pip(venv):
+    """Upgrade pip, setuptools, wheel in the specified venv."""
+    py = os.path.join(venv, "bin", "python")
+    subprocess.check_call(
+        [py, "-m", "pip", "install", "--upgrade", "pip", "setuptools", "wheel"]
+    )
+
+
+def site_packages(venv):
+    """Return the site-packages directory of the specified venv."""
+    found = glob.glob(os.path.join(venv, "lib", "python*", "site-packages"))
+    if not found:
+        raise RuntimeError(f"site-packages not found in {venv}")
+    return found[0]
+
+
+def _snapshot(path):
+    """Map each top-level entry of a directory to its (inode, mtime)."""
+    snap = {}
+    with os.scandir(path) as it:
+        for e in it:
+            st = e.stat(follow_symlinks=False)
+            snap[e.name] = (st.st_ino, st.st_mtime_ns)
+    return snap
+
+
+def _copy_entry(src_dir, dst_dir, name):
+    src = os.path.join(src_dir, name)
+    dst = os.path.join(dst_dir, name)
+    if os.path.isdir(src) and not os.path.islink(src):
+        shutil.copytree(src, dst, symlinks=True)
+    else:
+        shutil.copy2(src, dst, follow_symlinks=False)
+
+
+def _remove_entry(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class _PooledVenv:
+    """A venv plus the snapshot needed to reset it after use."""
+
+    def __init__(self, path, template_site):
+        self.path = path
+        self.template_site = template_site
+        self.site = site_packages(path)
+        self.bin_snapshot = None
+        self.site_snapshot = None
+
+    def populate(self):
+        """Copy the template site-packages into this venv and snapshot it."""
+        for name in os.listdir(self.template_site):
+            _remove_entry(os.path.join(self.site, name))
+            _copy_entry(self.template_site, self.site, name)
+        self.site_snapshot = _snapshot(self.site)
+        self.bin_snapshot = _snapshot(os.path.join(self.path, "bin"))
+
+    def reset(self):
+        """Bring site-packages and bin/ back to the post-populate snapshot."""
+        current = _snapshot(self.site)
+        for name, state in current.items():
+            if name not in self.site_snapshot:
+                _remove_entry(os.path.join(self.site, name))
+            elif state != self.site_snapshot[name]:
+                _remove_entry(os.path.join(self.site, name))
+                _copy_entry(self.template_site, self.site, name)
+        for name in self.site_snapshot:
+            if name not in current:
+                _copy_entry(self.template_site, self.site, name)
+
+        bin_dir = os.path.join(self.path, "bin")
+        for name in _snapshot(bin_dir):
+            if name not in self.bin_snapshot:
+                _remove_entry(os.path.join(bin_dir, name))
+
+        # Record new inodes/mtimes of restored entries
+        self.site_snapshot = _snapshot(self.site)
+
+
+class VenvPool:
+    """Thread-safe pool of reusable venvs, one sub-pool per interpreter."""
+
+    def __init__(self, python_bin_map, size):
+        self.python_bin_map = python_bin_map
+        self.size = size
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._template_locks = {tag: threading.Lock() for tag in python_bin_map}
+        self._idle = {tag: queue.Queue() for tag in python_bin_map}
+        self._created = {tag: 0 for tag in python_bin_map}
+        self._all = []
+
+    def _template(self, py_tag):
+        """Create (once) the upgraded template venv for an interpreter."""
+        with self._template_locks[py_tag]:
+            if py_tag not in self._templates:
+                venv = create_venv(self.python_bin_map[py_tag])
+                try:
+                    upgrade_pip(venv)
+                except Exception:
+                    shutil.rmtree(venv, ignore_errors=True)
+                    raise
+                with self._lock:
+                    self._all.append(venv)
+                self._templates[py_tag] = site_packages(venv)
+            return self._templates[py_tag]
+
+    def _new_venv(self, py_tag):
+        template_site = self._template(py_tag)
+        path = create_venv(self.python_bin_map[py_tag], with_pip=False)
+        with self._lock:
+            self._all.append(path)
+        v = _PooledVenv(path, template_site)
+        v.populate()
+        return v
+
+    def _discard(self, py_tag, v):
+        """Drop a broken venv; its slot is refilled lazily by the next checkout."""
+        shutil.rmtree(v.path, ignore_errors=True)
+        with self._lock:
+            if v.path in self._all:
+                self._all.remove(v.path)
+        self._idle[py_tag].put(None)
+
+    def _acquire(self, py_tag):
+        idle = self._idle[py_tag]
+        with self._lock:
+            grow = idle.empty() and self._created[py_tag] < self.size
+            if grow:
+                self._created[py_tag] += 1
+
+        # None marks a reserved slot that still needs a venv
+        v = None if grow else idle.get()
+        if v is not None:
+            return v
+        try:
+            return self._new_venv(py_tag)
+        except Exception:
+            idle.put(None)
+            raise
+
+    @contextmanager
+    def checkout(self, py_tag):
+        """Yield a clean venv path for py_tag and return it to the pool after use."""
+        v = self._acquire(py_tag)
+        try:
+            yield v.path
+        finally:
+            try:
+                v.reset()
+            except Exception as e:
+                print(f"[WARN] venv reset failed, discarding {v.path}: {e}")
+                self._discard(py_tag, v)
+            else:
+                self._idle[py_tag].put(v)
+
+    def close(self):
+        """Remove every venv created by this pool."""
+        with self._lock:
+            paths, self._all = self._all, []
+        for p in paths:
+            shutil.rmtree(p, ignore_errors=True)
@@ -0,0 +1,112 @@
+"""
+Pool of isolated build-scripts workspaces for concurrent source builds.
+
+read_buildinfo.sh writes variable.sh into its working tree and build_wheels.py
+runs relative to its own checkout, so two builds must never share one tree.
+Each workspace is a detached `git worktree` of the shared build-scripts clone
+(objects are shared, so creating one is cheap), with a copy-on-write copy
+(`cp -a --reflink=auto`) as fallback when worktrees are unavailable.
+Workspaces are kept between runs and reset to the source commit every time
+they are checked out.
+"""
+
+import os
+import queue
+import shutil
+import threading
+import subprocess
+from contextlib import contextmanager
+
+
+def _git(args, cwd):
+    return subprocess.run(
+        ["git"] + list(args),
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+class WorkspacePool:
+    """Thread-safe pool of up to size workspaces cloned from source_dir."""
+
+    def __init__(self, source_dir, root, size):
+        self.source_dir = source_dir
+        self.root = root
+        self.size = size
+        os.makedirs(root, exist_ok=True)
+
+        r = _git(["rev-parse", "HEAD"], source_dir)
+        self.commit = r.stdout.strip() if r.returncode == 0 else None
+        if self.commit:
+            # Forget worktrees whose directories were removed since last run
+            _git(["worktree", "prune"], source_dir)
+
+        self._lock = threading.Lock()
+        self._idle = queue.Queue()
+        self._created = 0
+        self._is_worktree = {}
+
+    def _create(self, path):
+        if self.commit:
+            if os.path.isdir(path) and _git(["rev-parse", "--git-dir"], path).returncode == 0:
+                return True
+            shutil.rmtree(path, ignore_errors=True)
+            _git(["worktree", "prune"], self.source_dir)
+            r = _git(["worktree", "add", "--detach", "--force", path, self.commit], self.source_dir)
+            if r.returncode == 0:
+                return True
+            print(f"[WARN] git worktree add failed, copying instead: {r.stderr.strip()}")
+
+        shutil.rmtree(path, ignore_errors=True)
+        subprocess.run(["cp", "-a", "--reflink=auto", self.source_dir, path], check=True)
+        return False
+
+    def _reset(self, path):
+        """Bring a workspace back to the source commit, dropping build leftovers."""
+        if self._is_worktree[path]:
+            r = _git(["checkout", "-q", "--detach", "--force", self.commit], path)
+            if r.returncode == 0:
+                r = _git(["clean", "-fdxq"], path)
+            if r.returncode != 0:
+                raise RuntimeError(f"Failed to reset workspace {path}: {r.stderr.strip()}")
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+            self._create(path)
+
+    def _acquire(self):
+        with self._lock:
+            grow = self._idle.empty() and self._created < self.size
+            if grow:
+                n = self._created
+                self._created += 1
+        if not grow:
+            return self._idle.get()
+
+        path = os.path.join(self.root, f"ws-{n}")
+        try:
+            self._is_worktree[path] = self._create(path)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        return path
+
+    @contextmanager
+    def checkout(self):
+        """Yield the path of a clean workspace reserved for the caller."""
+        path = self._acquire()
+        try:
+            self._reset(path)
+            yield path
+        finally:
+            self._idle.put(path)
+
+    def close(self):
+        """Remove all workspaces (they are normally kept for the next run)."""
+        while not self._idle.empty():
+            path = self._idle.get()
+            if self._is_worktree.get(path):
+                _git(["worktree", "remove", "--force", path], self.source_dir)
+            shutil.rmtree(path, ignore_errors=True)